@@ -1,4 +1,5 @@
 from cbm_login_functions import login
+from cbm_login_functions import store_all_login_credentials
 from progressor_functions import nav_to_tables
 from progressor_functions import change_timer_value
 from progressor_functions import check_and_fill_data
@@ -13,51 +14,137 @@ from data_cleaning_functions import combine_big_frames
 from data_cleaning_functions import save_files_by_student
 from data_cleaning_functions import save_files_by_class
 from data_processing_functions import create_class_question_type_recommendations
-from data_processing_functions import create_student_question_type_recommendations
+from data_processing_functions import create_district_student_recommendations
 from data_visualization_functions import create_all_class_charts
 from data_visualization_functions import create_all_student_charts
+from frame_storage_functions import set_frame_format
+from incremental_run_functions import load_manifest
+from incremental_run_functions import save_manifest
+from pipeline_functions import create_pipeline
+from pipeline_functions import clean_account_frames
+from pipeline_functions import build_big_frame
+from batch_collection_functions import scrape_accounts
+from run_trace_functions import create_run_trace
+from run_trace_functions import traced_step
+from run_trace_functions import save_run_trace
+from run_trace_functions import print_run_trace_summary
 
 
-def data_collector(timer):
+# Score, combine, and date one account's scraped tables, in memory when a pipeline is given. parallel scores the
+# tests across up to max_workers processes
+def clean_account(un, test_file_names, combined_frames_folder, manifest, pipeline=None, trace=None, parallel=False,
+                  max_workers=None):
+    if pipeline is not None:
+        # Hand the scored and dated frames along in memory instead of through the intermediate folders
+        traced_step(trace, f"clean_account_frames/{un}", clean_account_frames, pipeline, un, test_file_names,
+                    combined_frames_folder)
+        return None
+    single_test_frames_folder = traced_step(trace, f"get_category_scores/{un}", get_category_scores, un,
+                                            test_file_names, parallel=parallel, max_workers=max_workers,
+                                            manifest=manifest)
+    traced_step(trace, f"combine_csv_files/{un}", combine_csv_files, un, single_test_frames_folder,
+                combined_frames_folder, manifest=manifest)
+    return traced_step(trace, f"add_date_data/{un}", add_date_data, combined_frames_folder, un, manifest=manifest)
+
+
+def data_collector(timer, manifest, pipeline=None, headless=False, trace=None, parallel=False, max_workers=None):
     while True:
-        logged_in_driver, un, pw, combined_frames_folder = login()
-        tables_driver = nav_to_tables(logged_in_driver)
-        date_data_saved_driver = save_test_date_data(tables_driver, combined_frames_folder, timer)
-        test_file_names, extracted_data_frames_folder = write_test_tables(date_data_saved_driver, un, timer)
-        check_and_fill_data(extracted_data_frames_folder)
-        tests_written_driver = nav_to_tables(tables_driver)
-        student_tables_written_driver = write_student_tables(tests_written_driver, test_file_names, un,
-                                                             extracted_data_frames_folder, timer)
-        single_test_frames_folder = get_category_scores(un, test_file_names)
-        combine_csv_files(un, single_test_frames_folder, combined_frames_folder)
-        processed_files_folder = add_date_data(combined_frames_folder, un)
-        student_tables_written_driver.quit()
+        # Login and check_and_fill_data times include waiting for the user's input
+        logged_in_driver, un, pw, combined_frames_folder = traced_step(trace, "login", login, headless)
+        tables_driver = traced_step(trace, f"nav_to_tables/{un}", nav_to_tables, logged_in_driver)
+        date_data_saved_driver = traced_step(trace, f"save_test_date_data/{un}", save_test_date_data, tables_driver,
+                                             combined_frames_folder, timer)
+        test_file_names, extracted_data_frames_folder = traced_step(trace, f"write_test_tables/{un}",
+                                                                    write_test_tables, date_data_saved_driver, un,
+                                                                    timer, trace=trace)
+        traced_step(trace, f"check_and_fill_data/{un}", check_and_fill_data, extracted_data_frames_folder)
+        tests_written_driver = traced_step(trace, f"nav_to_tables/{un}", nav_to_tables, tables_driver)
+        student_tables_written_driver = traced_step(trace, f"write_student_tables/{un}", write_student_tables,
+                                                    tests_written_driver, test_file_names, un,
+                                                    extracted_data_frames_folder, timer, trace=trace)
+        processed_files_folder = clean_account(un, test_file_names, combined_frames_folder, manifest, pipeline,
+                                               trace, parallel, max_workers)
 
         additional_login = input("Do you have any additional EasyCBM logins for your school? yes/no: ")
         if additional_login.lower() != 'yes':
+            # Collect grade levels while the last account is still logged in
+            grade_levels = traced_step(trace, "get_grade_levels", get_grade_levels, student_tables_written_driver)
+            student_tables_written_driver.quit()
             break
-    return processed_files_folder, un, pw
+        student_tables_written_driver.quit()
+    return processed_files_folder, un, grade_levels
+
+
+# Scrape every account at the same time, then check and clean each account's tables in the order entered
+def batch_data_collector(timer, manifest, accounts, max_scrapers, pipeline=None, headless=False, trace=None,
+                         parallel=False, max_workers=None):
+    # Accounts scrape on separate threads, so scraping is traced as a single stage
+    scraped_accounts, grade_levels = traced_step(trace, "scrape_accounts", scrape_accounts, accounts, timer,
+                                                 max_scrapers, headless)
+    if not scraped_accounts:
+        raise RuntimeError("No accounts were scraped successfully")
+
+    processed_files_folder, un = None, None
+    for account in scraped_accounts:
+        un = account['username']
+        # Missing question types are resolved one account at a time since this step prompts the user
+        traced_step(trace, f"check_and_fill_data/{un}", check_and_fill_data, account['extracted_data_frames_folder'])
+        processed_files_folder = clean_account(un, account['test_file_names'], account['combined_frames_folder'],
+                                               manifest, pipeline, trace, parallel, max_workers)
+    return processed_files_folder, un, grade_levels
 
 
-def process_data():
+# parallel=True scores tests and renders charts across up to max_workers processes (all cores by default)
+def process_data(frame_format='csv', in_memory=False, checkpoint=False, headless=False, batch=False, max_scrapers=2,
+                 trace_memory=False, parallel=False, max_workers=None):
     timer = 1
+    # Time every stage and save the trace with a summary table at the end of the run
+    trace = create_run_trace(trace_memory)
+    # Intermediate frames are written as csv by default or as typed Parquet files with frame_format='parquet'
+    set_frame_format(frame_format)
+    # Record what each cleaning stage consumed and produced so unchanged stages are skipped on the next run
+    manifest = load_manifest()
+    # Batch mode takes every account up front and scrapes up to max_scrapers of them at the same time
+    accounts = store_all_login_credentials() if batch else None
     while True:
         try:
-            folder, un, pw = data_collector(timer)
-            grade_levels = get_grade_levels(un, pw)
-            big_df = combine_big_frames(folder, grade_levels)
-            class_file_folder = save_files_by_class(big_df)
-            student_file_folder = save_files_by_student(big_df)
-            processed_files_folder_class = create_all_class_charts(class_file_folder)
-            create_class_question_type_recommendations(class_file_folder)
-            processed_files_folder = create_all_student_charts(student_file_folder, processed_files_folder_class)
-            create_student_question_type_recommendations(student_file_folder)
+            # In-memory mode only writes intermediate frames to disk when checkpoint is requested
+            pipeline = create_pipeline(checkpoint=checkpoint, parallel=parallel,
+                                       max_workers=max_workers) if in_memory else None
+            if batch:
+                folder, un, grade_levels = batch_data_collector(timer, manifest, accounts, max_scrapers, pipeline,
+                                                                headless, trace, parallel, max_workers)
+            else:
+                folder, un, grade_levels = data_collector(timer, manifest, pipeline, headless, trace, parallel,
+                                                          max_workers)
+            if pipeline is not None:
+                big_df = traced_step(trace, "build_big_frame", build_big_frame, pipeline, grade_levels)
+            else:
+                big_df = traced_step(trace, "combine_big_frames", combine_big_frames, folder, grade_levels,
+                                     manifest=manifest)
+            class_file_folder = traced_step(trace, "save_files_by_class", save_files_by_class, big_df,
+                                            manifest=manifest, rows=len(big_df))
+            student_file_folder = traced_step(trace, "save_files_by_student", save_files_by_student, big_df,
+                                              manifest=manifest, rows=len(big_df))
+            save_manifest(manifest)
+            processed_files_folder_class = traced_step(trace, "create_all_class_charts", create_all_class_charts,
+                                                       class_file_folder, parallel=parallel, max_workers=max_workers)
+            traced_step(trace, "create_class_question_type_recommendations",
+                        create_class_question_type_recommendations, class_file_folder)
+            processed_files_folder = traced_step(trace, "create_all_student_charts", create_all_student_charts,
+                                                 student_file_folder, processed_files_folder_class,
+                                                 parallel=parallel, max_workers=max_workers)
+            traced_step(trace, "create_district_student_recommendations", create_district_student_recommendations,
+                        big_df, student_file_folder)
             print("Data processing complete. Check the 'Processed Frames by Class' folder in your File Explorer to view"
                   " your testing data.")
+            print_run_trace_summary(trace)
+            save_run_trace(trace)
             return processed_files_folder  # If successful, return and exit
         except ValueError:
             print("A ValueError occurred. Attempting to adjust timer and retry...")
             timer = change_timer_value()  # Adjust timer if needed
 
 
-process_data()
+if __name__ == '__main__':
+    process_data()
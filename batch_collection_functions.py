@@ -0,0 +1,95 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from cbm_login_functions import create_destination_folder
+from cbm_login_functions import login_account
+from progressor_functions import nav_to_tables
+from cbm_site_data_collection_functions import save_test_date_data
+from cbm_site_data_collection_functions import write_test_tables
+from cbm_site_data_collection_functions import write_student_tables
+from cbm_site_data_collection_functions import get_grade_levels
+
+
+# Scrape one account in its own browser and download directory, returning what the cleaning stages need
+def scrape_account(cbm_username, cbm_password, timer, headless=False, collect_grade_levels=False):
+    combined_frames_folder = create_destination_folder(cbm_username)
+    driver = login_account(cbm_username, cbm_password, combined_frames_folder, headless)
+    if driver is None:
+        raise RuntimeError(f"invalid login for {cbm_username}")
+
+    try:
+        tables_driver = nav_to_tables(driver)
+        save_test_date_data(tables_driver, combined_frames_folder, timer)
+        test_file_names, extracted_data_frames_folder = write_test_tables(tables_driver, cbm_username, timer)
+        nav_to_tables(tables_driver)
+        write_student_tables(tables_driver, test_file_names, cbm_username, extracted_data_frames_folder, timer)
+        grade_levels = get_grade_levels(tables_driver) if collect_grade_levels else None
+    finally:
+        driver.quit()
+
+    return {
+        'username': cbm_username,
+        'test_file_names': test_file_names,
+        'extracted_data_frames_folder': extracted_data_frames_folder,
+        'combined_frames_folder': combined_frames_folder,
+        'grade_levels': grade_levels,
+    }
+
+
+# Log in to one account only to collect grade levels, for when the account that was meant to collect them failed
+def fetch_grade_levels(cbm_username, cbm_password, headless=False):
+    driver = login_account(cbm_username, cbm_password, create_destination_folder(cbm_username), headless)
+    if driver is None:
+        raise RuntimeError(f"invalid login for {cbm_username}")
+
+    try:
+        return get_grade_levels(driver)
+    finally:
+        driver.quit()
+
+
+# Scrape several accounts at the same time, each with its own driver, running at most max_workers browsers at once.
+# Grade levels come from the last account, as in the one-at-a-time collector, or from the first account that scraped
+# successfully if the last one failed. Raises RuntimeError if no account can provide them
+def scrape_accounts(accounts, timer, max_workers=2, headless=False):
+    scraped_accounts = {}
+    failed_accounts = {}
+    last_username = accounts[-1][0] if accounts else None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(scrape_account, cbm_username, cbm_password, timer, headless,
+                                   cbm_username == last_username): cbm_username
+                   for cbm_username, cbm_password in accounts}
+        for future in as_completed(futures):
+            cbm_username = futures[future]
+            try:
+                scraped_accounts[cbm_username] = future.result()
+                print(f"Finished scraping {cbm_username}")
+            except Exception as e:
+                print(f"ERROR: Failed to scrape {cbm_username}: {e}")
+                failed_accounts[cbm_username] = e
+
+    if failed_accounts:
+        print(f"Scraping failed for {len(failed_accounts)} of {len(accounts)} accounts: {list(failed_accounts)}")
+        # Timing-related ValueErrors are re-raised so the caller can raise the timer and retry
+        for error in failed_accounts.values():
+            if isinstance(error, ValueError):
+                raise error
+
+    # Keep the order the accounts were entered in
+    results = [scraped_accounts[cbm_username] for cbm_username, _ in accounts if cbm_username in scraped_accounts]
+    if last_username in scraped_accounts:
+        grade_levels = scraped_accounts[last_username]['grade_levels']
+    else:
+        grade_levels = None
+        passwords = dict(accounts)
+        for result in results:
+            print(f"Collecting grade levels from {result['username']} since {last_username} failed")
+            try:
+                grade_levels = fetch_grade_levels(result['username'], passwords[result['username']], headless)
+                break
+            except Exception as e:
+                print(f"ERROR: Failed to collect grade levels from {result['username']}: {e}")
+    # Without grade levels every student would be labelled a former student, so the run stops here instead
+    if results and not grade_levels:
+        raise RuntimeError("Grade levels could not be collected from any account")
+
+    return results, grade_levels
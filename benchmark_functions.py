@@ -0,0 +1,133 @@
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import tracemalloc
+from contextlib import redirect_stdout
+from pathlib import Path
+from synthetic_data_functions import generate_district_data
+from data_cleaning_functions import get_category_scores
+from data_cleaning_functions import combine_csv_files
+from data_cleaning_functions import add_date_data
+from data_cleaning_functions import combine_big_frames
+from data_cleaning_functions import save_files_by_class
+from data_cleaning_functions import save_files_by_student
+from data_processing_functions import create_class_question_type_recommendations
+from data_processing_functions import create_district_student_recommendations
+from data_visualization_functions import create_all_class_charts
+from data_visualization_functions import create_all_student_charts
+
+
+# District sizes benchmarked by default, from a single school up to a mid-sized district
+BENCHMARK_SIZES = [
+    {'students': 100, 'tests': 3, 'items': 30, 'categories': 5, 'accounts': 2},
+    {'students': 500, 'tests': 3, 'items': 30, 'categories': 5, 'accounts': 4},
+    {'students': 2000, 'tests': 3, 'items': 30, 'categories': 5, 'accounts': 8},
+]
+
+
+# Run one pipeline stage with its output silenced, recording wall time, throughput, and peak traced memory.
+# Memory used inside worker processes is not traced, so parallel stages only report the parent's peak
+def time_stage(stage_results, stage_name, rows, step, *args, **kwargs):
+    tracemalloc.reset_peak()
+    start_time = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        result = step(*args, **kwargs)
+    seconds = time.perf_counter() - start_time
+    peak_memory = tracemalloc.get_traced_memory()[1]
+
+    stage_results.append({
+        'stage': stage_name,
+        'seconds': round(seconds, 4),
+        'rows_per_second': round(rows / seconds, 1) if seconds else None,
+        'peak_memory_mb': round(peak_memory / 1024 ** 2, 2),
+    })
+    return result
+
+
+# Generate a synthetic district under root_folder and time every stage from scoring through the student charts
+def benchmark_district(root_folder, students=500, tests=3, items=30, categories=5, accounts=2, parallel=False,
+                       charts=True):
+    test_lists, grade_levels = generate_district_data(root_folder, students, tests, items, categories, accounts)
+    # Rows in BIG_DF: every student takes each test window for their grade
+    rows = students * tests
+
+    # Pipeline folders are resolved against the working directory's parent
+    working_folder = os.path.join(root_folder, 'run')
+    os.makedirs(working_folder, exist_ok=True)
+    previous_folder = os.getcwd()
+    os.chdir(working_folder)
+
+    stage_results = []
+    tracemalloc.start()
+    try:
+        for username, test_list in test_lists.items():
+            combined_frames_folder = os.path.join(root_folder, 'Combined Frames by User', username)
+            single_test_frames_folder = time_stage(stage_results, f'get_category_scores/{username}', rows / accounts,
+                                                   get_category_scores, username, test_list, parallel=parallel)
+            time_stage(stage_results, f'combine_csv_files/{username}', rows / accounts, combine_csv_files, username,
+                       single_test_frames_folder, combined_frames_folder)
+            dated_frames_folder = time_stage(stage_results, f'add_date_data/{username}', rows / accounts,
+                                             add_date_data, combined_frames_folder, username)
+
+        big_df = time_stage(stage_results, 'combine_big_frames', rows, combine_big_frames, dated_frames_folder,
+                            grade_levels)
+        class_file_folder = time_stage(stage_results, 'save_files_by_class', rows, save_files_by_class, big_df)
+        student_file_folder = time_stage(stage_results, 'save_files_by_student', rows, save_files_by_student,
+                                         big_df)
+        processed_files_folder_class = os.path.join(Path.cwd().parent, "Processed Frames by Class")
+        if charts:
+            processed_files_folder_class = time_stage(stage_results, 'create_all_class_charts', rows,
+                                                      create_all_class_charts, class_file_folder, parallel=parallel)
+        time_stage(stage_results, 'create_class_question_type_recommendations', rows,
+                   create_class_question_type_recommendations, class_file_folder)
+        if charts:
+            time_stage(stage_results, 'create_all_student_charts', rows, create_all_student_charts,
+                       student_file_folder, processed_files_folder_class, parallel=parallel)
+        time_stage(stage_results, 'create_district_student_recommendations', rows,
+                   create_district_student_recommendations, big_df, student_file_folder)
+    finally:
+        tracemalloc.stop()
+        os.chdir(previous_folder)
+
+    return stage_results
+
+
+# Print one size's stage timings as a table
+def print_benchmark_table(size, stage_results):
+    print(f"\n{size['students']} students, {size['tests']} tests, {size['items']} items, "
+          f"{size['categories']} categories, {size['accounts']} accounts")
+    print(f"{'Stage':<48}{'Seconds':>10}{'Rows/sec':>12}{'Peak MB':>10}")
+    for result in stage_results:
+        print(f"{result['stage']:<48}{result['seconds']:>10.3f}{result['rows_per_second'] or 0:>12.1f}"
+              f"{result['peak_memory_mb']:>10.2f}")
+    print(f"{'Total':<48}{sum(result['seconds'] for result in stage_results):>10.3f}")
+
+
+# Benchmark the pipeline at each size in a scratch folder, printing a table per size and saving all results as json
+def run_benchmarks(sizes=None, output_path='benchmark_results.json', parallel=False, charts=True, keep_data=False):
+    benchmark_results = []
+    for size in sizes or BENCHMARK_SIZES:
+        root_folder = tempfile.mkdtemp(prefix='cbm_benchmark_')
+        try:
+            stage_results = benchmark_district(root_folder, size['students'], size['tests'], size['items'],
+                                               size['categories'], size['accounts'], parallel, charts)
+        finally:
+            if keep_data:
+                print(f"Synthetic district kept in {root_folder}")
+            else:
+                shutil.rmtree(root_folder, ignore_errors=True)
+        print_benchmark_table(size, stage_results)
+        benchmark_results.append({'size': size, 'parallel': parallel, 'stages': stage_results})
+
+    with open(output_path, 'w') as f:
+        json.dump(benchmark_results, f, indent=4)
+    print(f"\nBenchmark results saved: {output_path}")
+
+    return benchmark_results
+
+
+if __name__ == '__main__':
+    run_benchmarks(charts='--no-charts' not in sys.argv, parallel='--parallel' in sys.argv)
@@ -8,6 +8,11 @@ from selenium.webdriver.support import expected_conditions as ec
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
 
 
+# Address of the EasyCBM site; setting CBM_BASE_URL points the scrapers at a local fixture server instead
+def site_url(path=''):
+    return os.environ.get('CBM_BASE_URL', 'https://app.easycbm.com') + path
+
+
 # Store site login credentials as variables to use throughout the program
 def store_login_credentials():
     print("Please enter your Easy CBM login credentials. If you possess multiple administrator \n"
@@ -31,54 +36,104 @@ def create_destination_folder(username):
     return frame_folder
 
 
-# Configure the web driver
-def configure_driver(download_dir):
+# Fixed browser viewport used in place of maximizing the window, so page layout does not depend on the screen
+WINDOW_SIZE = (1920, 1080)
+
+# Resources the scraper never reads; blocked in headless mode to cut page load time and memory. Stylesheets are kept
+# because element visibility and text, which the scraper relies on, depend on them
+BLOCKED_RESOURCE_PATTERNS = ["*.png", "*.jpg", "*.jpeg", "*.gif", "*.svg", "*.ico", "*.webp",
+                             "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot", "*.mp4", "*.webm"]
+
+
+# Configure the web driver; headless runs without a window and skips images, fonts, and media
+def configure_driver(download_dir, headless=False):
     options = Options()
-    options.add_experimental_option("prefs", {
+    prefs = {
         "download.default_directory": download_dir,
         "download.prompt_for_download": False,
         "download.directory_upgrade": True,
         "safebrowsing.enabled": True
-    })
+    }
+    if headless:
+        options.add_argument("--headless=new")
+        options.add_argument(f"--window-size={WINDOW_SIZE[0]},{WINDOW_SIZE[1]}")
+        options.add_argument("--disable-extensions")
+        options.add_argument("--disable-dev-shm-usage")
+        prefs["profile.managed_default_content_settings.images"] = 2
+    options.add_experimental_option("prefs", prefs)
     driver = webdriver.Chrome(options=options)
+
+    if headless:
+        # Allow the All_Students csv download without a browser window
+        driver.execute_cdp_cmd("Browser.setDownloadBehavior", {"behavior": "allow", "downloadPath": download_dir})
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_RESOURCE_PATTERNS})
+    else:
+        driver.set_window_size(*WINDOW_SIZE)
+
     return driver
 
 
+# Log in to the website with one set of credentials, returning the logged-in driver or None if the login fails
+def login_account(cbm_username, cbm_password, frame_folder, headless=False):
+    driver = configure_driver(frame_folder, headless)
+
+    driver.get(site_url())
+
+    # Wait for the page to load as evidenced by sign-in being clickable
+    print(f"Logging in as {cbm_username}...")
+
+    # Locate the email input field and fill it with your email
+    wait = WebDriverWait(driver, 10)
+    wait.until(ec.presence_of_element_located((By.ID, "username")))
+    email_input = driver.find_element(By.ID, "username")
+    email_input.send_keys(cbm_username)
+
+    # Locate the password input field and fill it with your password
+    password_input = driver.find_element(By.ID, "password")
+    password_input.send_keys(cbm_password)
+
+    # Click the login button
+    sign_in_button = driver.find_element(By.CSS_SELECTOR, "button[type='submit']")
+    sign_in_button.click()
+
+    try:
+        wait = WebDriverWait(driver, 10)
+        logout_button = wait.until(ec.element_to_be_clickable((By.CSS_SELECTOR,
+                                                               "a[href='/teachers/logout.php']")))
+        if logout_button:
+            print(f"login successful for {cbm_username}")
+            return driver
+    except (TimeoutException, NoSuchElementException):
+        print(f"ERROR: invalid login for {cbm_username}")
+        driver.quit()
+
+    return None
+
+
 # Log in to the website
-def login():
+def login(headless=False):
     # In case of login error, loop through the login process until there is a successful login
     while True:
         cbm_username, cbm_password = store_login_credentials()
         frame_folder = create_destination_folder(cbm_username)
-        driver = configure_driver(frame_folder)
+        driver = login_account(cbm_username, cbm_password, frame_folder, headless)
 
-        driver.get("https://app.easycbm.com")
+        # If login is successful, return objects and break the loop
+        if driver is not None:
+            return driver, cbm_username, cbm_password, frame_folder
+        print("Please re-enter your login credentials")
 
-        # Wait for the page to load as evidenced by sign-in being clickable
-        print("Logging in...")
 
-        # Locate the email input field and fill it with your email
-        wait = WebDriverWait(driver, 10)
-        wait.until(ec.presence_of_element_located((By.ID, "username")))
-        email_input = driver.find_element(By.ID, "username")
-        email_input.send_keys(cbm_username)
-
-        # Locate the password input field and fill it with your password
-        password_input = driver.find_element(By.ID, "password")
-        password_input.send_keys(cbm_password)
-
-        # Click the login button
-        sign_in_button = driver.find_element(By.CSS_SELECTOR, "button[type='submit']")
-        sign_in_button.click()
-
-        try:
-            wait = WebDriverWait(driver, 10)
-            logout_button = wait.until(ec.element_to_be_clickable((By.CSS_SELECTOR,
-                                                                   "a[href='/teachers/logout.php']")))
-            # If login is successful, return objects and break the loop
-            if logout_button:
-                print("login successful")
-                return driver, cbm_username, cbm_password, frame_folder
-        except (TimeoutException, NoSuchElementException):
-            print("ERROR: invalid login. Please re-enter your login credentials")
-            driver.quit()
+# Collect every administrator account up front for batch scraping
+def store_all_login_credentials():
+    print("Please enter each of your Easy CBM administrator logins. Press ENTER at the user name prompt when done.")
+    accounts = []
+    while True:
+        cbm_username = input("Easy CBM user name: ")
+        if not cbm_username:
+            break
+        cbm_password = input("Easy CBM password: ")
+        accounts.append((cbm_username, cbm_password))
+
+    return accounts
@@ -2,46 +2,214 @@ from bs4 import BeautifulSoup
 import json
 import time
 import os
+import threading
 from pathlib import Path
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as ec
 from selenium.webdriver.support.ui import WebDriverWait
-from selenium.common.exceptions import WebDriverException, NoSuchElementException, TimeoutException
-import glob
+from selenium.common.exceptions import WebDriverException, TimeoutException, StaleElementReferenceException
 import pandas as pd
+from cbm_login_functions import site_url
+from scrape_recording_functions import record_test_buttons, record_table, record_grade_level, record_download
+from run_trace_functions import start_trace_stage, end_trace_stage
+from test_date_file_functions import PARTIAL_DOWNLOAD_SUFFIXES, test_date_file_times, test_date_file_is_complete
+
+
+# In-browser script returning the header and row cell text of a single table, so the page source never has to be
+# serialized and re-parsed
+TABLE_EXTRACTION_SCRIPT = """
+const [tableId, headerBlockSelector, headerCellTag, bodySelector] = arguments;
+const table = document.getElementById(tableId);
+if (!table) {
+    return null;
+}
+const cellTexts = (element, tag) => Array.from(element.getElementsByTagName(tag), cell => cell.textContent);
+const headerBlock = table.querySelector(headerBlockSelector);
+const body = table.querySelector(bodySelector);
+return {
+    headers: headerBlock ? cellTexts(headerBlock, headerCellTag) : [],
+    rows: body ? Array.from(body.getElementsByTagName('tr'), row => cellTexts(row, 'td')) : []
+};
+"""
+
+
+# Pull the header and row cell text of one table from the current page. The 'script' backend reads the table in the
+# browser; 'lxml' and 'html5lib' parse the full page source with BeautifulSoup. Returns None if the table is missing
+def extract_table_cells(driver, table_id, header_block_selector, header_cell_tag, body_selector, backend='script'):
+    if backend == 'script':
+        table_cells = driver.execute_script(TABLE_EXTRACTION_SCRIPT, table_id, header_block_selector,
+                                            header_cell_tag, body_selector)
+        if table_cells is None:
+            return None
+        return table_cells['headers'], table_cells['rows']
+
+    # Parse the html
+    source = driver.page_source.encode('utf-8').strip()
+    soup = BeautifulSoup(source, backend)
+
+    table = soup.find('table', id=table_id)
+    if table is None:
+        return None
+
+    headers_block = table.select_one(header_block_selector)
+    headers = [header.text for header in headers_block.find_all(header_cell_tag)] if headers_block else []
+    body = table.select_one(body_selector)
+    rows = [[val.text for val in row.find_all('td')] for row in body.find_all('tr')] if body else []
+
+    return headers, rows
+
+
+# Base time, in seconds, to wait for a report table to render after a test is selected; the scrape timer is added on
+# top of it, so a longer timer entered after a failed run gives slow tables more time
+TABLE_WAIT_TIMEOUT = 10
+
+# (table, test) pairs whose table was still unchanged at the timeout once. process_data's retry extracts them with a
+# warning instead of failing again, since a test can legitimately show the same table as the one before it
+unchanged_tables = set()
+
+# In-browser script returning a cheap signature of a table's contents, or null if the table is not on the page
+TABLE_SIGNATURE_SCRIPT = """
+const table = document.getElementById(arguments[0]);
+if (!table) {
+    return null;
+}
+const text = table.textContent;
+let hash = 0;
+for (let i = 0; i < text.length; i++) {
+    hash = (hash * 31 + text.charCodeAt(i)) | 0;
+}
+return table.getElementsByTagName('tr').length + ':' + text.length + ':' + hash;
+"""
+
+
+# Signature of a table's current contents, used to tell when a newly selected test has replaced the previous one
+def table_signature(driver, table_id):
+    return driver.execute_script(TABLE_SIGNATURE_SCRIPT, table_id)
+
+
+# Wait until a table has rendered and its contents differ from the previous test, recording how long it took.
+# The first time the previous test's table is still showing at the timeout, raises ValueError rather than let it be
+# saved under this test's name, so process_data retries with a longer timer. If it is still the same on the retry, a
+# warning is printed and the table is extracted as it is. A table that never rendered returns None
+def wait_for_table_change(driver, table_id, previous_signature, timeout, wait_log, label):
+    def table_changed(d):
+        signature = table_signature(d, table_id)
+        return signature if signature is not None and signature != previous_signature else False
+
+    start_time = time.perf_counter()
+    try:
+        signature = WebDriverWait(driver, timeout, poll_frequency=0.1).until(table_changed)
+        timed_out = False
+    except TimeoutException:
+        signature = table_signature(driver, table_id)
+        timed_out = True
+
+    wait_log.append({'table': table_id, 'test': label, 'seconds': round(time.perf_counter() - start_time, 3),
+                     'timed_out': timed_out})
+    if timed_out and signature is not None:
+        if (table_id, label) not in unchanged_tables:
+            unchanged_tables.add((table_id, label))
+            report_wait_latencies(wait_log)
+            raise ValueError(f"{table_id} still showed the previous test {timeout} sec after selecting {label}")
+        print(f"WARNING: {table_id} for {label} was still identical to the previous test's after {timeout} sec. It "
+              f"is saved as shown; check it against the site")
+
+    return signature
+
+
+# Summarize the recorded table wait latencies
+def report_wait_latencies(wait_log):
+    if not wait_log:
+        return
+    latencies = [wait['seconds'] for wait in wait_log]
+    timed_out = [wait['test'] for wait in wait_log if wait['timed_out']]
+    print(f"Table waits: {len(latencies)}, mean {sum(latencies) / len(latencies):.2f} sec, "
+          f"max {max(latencies):.2f} sec, timed out: {timed_out if timed_out else 'none'}")
+
+
+# Seconds between download checks; with watchdog installed this is only a fallback for missed filesystem events
+DOWNLOAD_POLL_INTERVAL = 0.5
+
+
+# Partial download files currently in the download directory
+def partial_downloads(download_dir):
+    return {filename for filename in os.listdir(download_dir) if filename.endswith(PARTIAL_DOWNLOAD_SUFFIXES)}
+
+
+# Watch the download directory for filesystem events if watchdog is installed, setting changed on every event.
+# Returns the observer to stop, or None when downloads have to be found by polling alone
+def watch_download_dir(download_dir, changed):
+    try:
+        from watchdog.observers import Observer
+        from watchdog.events import FileSystemEventHandler
+    except ImportError:
+        return None
+
+    class DownloadEventHandler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            changed.set()
+
+    observer = Observer()
+    observer.schedule(DownloadEventHandler(), download_dir, recursive=False)
+    observer.start()
+
+    return observer
+
+
+# Wait for a new or updated test date file that is finished downloading and parses, for up to timeout seconds.
+# Partial files left behind by earlier interrupted downloads are ignored
+def wait_for_test_date_file(download_dir, previous_file_times, previous_partials, timeout):
+    changed = threading.Event()
+    observer = watch_download_dir(download_dir, changed)
+    deadline = time.perf_counter() + timeout
+    try:
+        while True:
+            changed.clear()
+            if not partial_downloads(download_dir) - previous_partials:
+                for file_path, modified_time in test_date_file_times(download_dir).items():
+                    if previous_file_times.get(file_path) != modified_time and test_date_file_is_complete(file_path):
+                        return file_path
+
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return None
+            changed.wait(min(DOWNLOAD_POLL_INTERVAL, remaining))
+    finally:
+        if observer is not None:
+            observer.stop()
+            observer.join()
 
 
 # Download the files with test date information since dates are not part of the item-by-item data used in analysis
-def save_test_date_data(driver, download_dir, timer):
+def save_test_date_data(driver, download_dir, timer, recorder=None):
+    # Remember the test date files already downloaded so a file from an earlier run is not mistaken for this one
+    previous_file_times = test_date_file_times(download_dir)
+    previous_partials = partial_downloads(download_dir)
+
     # Click the website button that automatically downloads a csv file with test date data
     test_dates_button = driver.find_element(By.CSS_SELECTOR, '[id^="gid_link"]')
     test_dates_button.click()
 
-    # Wait for the file to appear in the download directory
-    wait_time = 0
-    downloaded_file = None
-    while wait_time < 30:  # Wait up to 30 seconds
-        # Search for files starting with the specified prefix
-        files = glob.glob(os.path.join(download_dir, f"All_Students*"))
-        if files:
-            downloaded_file = files[0]
-            break
-        time.sleep(timer)
-        wait_time += 1
+    # Wait for the download to finish, up to 30 timer intervals
+    downloaded_file = wait_for_test_date_file(download_dir, previous_file_times, previous_partials,
+                                              30 * timer)
 
     # Check for successful download
     if downloaded_file:
         print(f"File downloaded successfully: {downloaded_file}")
+    elif previous_file_times:
+        downloaded_file = max(previous_file_times, key=previous_file_times.get)
+        print(f"Warning: File download timed out. Using the earlier download: {downloaded_file}")
     else:
         print("Error: File download timed out.")
+    record_download(recorder, downloaded_file)
     # time.sleep(timer)
 
     return driver
 
 
 # Create the test question data frames that will be combined for analysis
-def write_test_tables(driver, username, sleep_timer):
+def write_test_tables(driver, username, sleep_timer, backend='script', wait_log=None, recorder=None, trace=None):
 
     # Create the directory where raw data will be stored
     print('Creating destination directory for testing information files')
@@ -55,45 +223,40 @@ def write_test_tables(driver, username, sleep_timer):
     # creating list of successfully saved test frames to send to student frame writer
     test_frame_names = []
 
+    # A longer sleep_timer raises the wait ceiling for very slow connections
+    wait_timeout = TABLE_WAIT_TIMEOUT + sleep_timer
+    table_waits = []
+    signature = table_signature(driver, 'reportItemAnalysisTable')
+
     # Wait for element to be present that tells the driver to proceed
     wait = WebDriverWait(driver, 10)
     wait.until(ec.element_to_be_clickable((By.CLASS_NAME, "fleft")))
 
     # Select the desired test:
     test_buttons = driver.find_elements(By.CLASS_NAME, "fleft")
+    record_test_buttons(recorder, [button.text for button in test_buttons])
     for button in test_buttons:
         if "Basic" in button.text or "Proficient" in button.text:
+            start_trace_stage(trace, f"scrape_test_table/{button.text}")
             button.click()
 
-            # Give the browser time to load the data
-            time.sleep(sleep_timer)
-
-            # Parse the html
-            source = driver.page_source.encode('utf-8').strip()
-            soup = BeautifulSoup(source, 'html5lib')
+            # Wait for this test's item analysis table to replace the previous one
+            signature = wait_for_table_change(driver, 'reportItemAnalysisTable', signature, wait_timeout,
+                                              table_waits, button.text)
+            record_table(recorder, driver, button.text, 'reportItemAnalysisTable')
 
             # Find the test items data table
-            test_items_data_table = soup.find('table', id='reportItemAnalysisTable')
+            test_items_data_table = extract_table_cells(driver, 'reportItemAnalysisTable', 'thead', 'th', 'tbody',
+                                                        backend)
 
             if test_items_data_table is None:
                 print(f'No item analysis data available for {button.text}')
+                end_trace_stage(trace, rows=0, files_written=0)
                 continue
             else:
                 print(f'Creating item analysis data frame for {button.text}...')
                 # Create test items data frame
-                test_items_headers = []
-                headers_block = test_items_data_table.find('thead')
-                headers_list = headers_block.find_all('th')
-                for header in headers_list:
-                    test_items_headers.append(header.text)
-
-                data_table_body = test_items_data_table.find('tbody')
-                test_items = []
-                for test_item in data_table_body.find_all('tr'):
-                    item_attributes = []
-                    for val in test_item.find_all('td'):
-                        item_attributes.append(val.text)
-                    test_items.append(item_attributes)
+                test_items_headers, test_items = test_items_data_table
 
                 print(f"Saving item analysis data frame for {button.text} to csv")
                 test_items_df = pd.DataFrame(data=test_items, columns=test_items_headers)
@@ -106,47 +269,49 @@ def write_test_tables(driver, username, sleep_timer):
 
                 # Add the test name to the list of processed tests
                 test_frame_names.append(button.text)
+                end_trace_stage(trace, rows=len(test_items_df), files_written=1)
+
+    report_wait_latencies(table_waits)
+    if wait_log is not None:
+        wait_log.extend(table_waits)
 
     return test_frame_names, frame_folder
 
 
 # Create class roster data frames that will be combined with test data
-def write_student_tables(driver, test_list, username, folder, sleep_timer):
+def write_student_tables(driver, test_list, username, folder, sleep_timer, backend='script', wait_log=None,
+                         recorder=None, trace=None):
 
-    # Give browser time to load the data
-    time.sleep(sleep_timer)
+    # Wait for the test list to load
+    wait_timeout = TABLE_WAIT_TIMEOUT + sleep_timer
+    WebDriverWait(driver, wait_timeout).until(ec.element_to_be_clickable((By.CLASS_NAME, "fleft")))
+    table_waits = []
+    signature = table_signature(driver, 'studentReportingTable')
 
     # Select the desired test:
     test_buttons = driver.find_elements(By.CLASS_NAME, "fleft")
     for button in test_buttons:
         if button.text in test_list:
+            start_trace_stage(trace, f"scrape_student_table/{button.text}")
             button.click()
 
-            # Give the browser time to load the data
-            time.sleep(sleep_timer)
-
-            # Parse the html
-            source = driver.page_source.encode('utf-8').strip()
-            soup = BeautifulSoup(source, 'html5lib')
+            # Wait for this test's student table to replace the previous one
+            signature = wait_for_table_change(driver, 'studentReportingTable', signature, wait_timeout,
+                                              table_waits, button.text)
+            record_table(recorder, driver, button.text, 'studentReportingTable')
 
             # Find the students data table
-            students_data_table = soup.find('table', id='studentReportingTable')
+            students_data_table = extract_table_cells(driver, 'studentReportingTable', 'tr', 'td',
+                                                      'table#studentReportingDataTable', backend)
+
+            if students_data_table is None:
+                print(f'No student data available for {button.text}')
+                end_trace_stage(trace, rows=0, files_written=0)
+                continue
 
             print(f'Creating student data frame for {button.text}...')
             # Create the students data frame
-            students_headers = []
-            headers_block = students_data_table.find('tr')
-            headers_list = headers_block.find_all('td')
-            for header in headers_list:
-                students_headers.append(header.text)
-
-            data_table_body = students_data_table.find('table', id='studentReportingDataTable')
-            student_items = []
-            for student_item in data_table_body.find_all('tr'):
-                item_attributes = []
-                for val in student_item.find_all('td'):
-                    item_attributes.append(val.text)
-                student_items.append(item_attributes)
+            students_headers, student_items = students_data_table
 
             print(f'Saving student data frame for {button.text} to csv')
 
@@ -158,73 +323,60 @@ def write_student_tables(driver, test_list, username, folder, sleep_timer):
 
             # Save the frame as a csv file
             students_df.to_csv(os.path.join(folder, f'{username}_{button.text}_student_data.csv'), index=False)
+            end_trace_stage(trace, rows=len(students_df), files_written=1)
 
-    return driver
-
-
-# Collect grade level data for separating students into groups
-def get_grade_levels(cbm_username, cbm_password):
+    report_wait_latencies(table_waits)
+    if wait_log is not None:
+        wait_log.extend(table_waits)
 
-    driver = webdriver.Chrome()
-    driver.get("https://app.easycbm.com")
-
-    # Wait for the page to load as evidenced by sign-in being clickable
-    print("Obtaining student grade-level information... ")
+    return driver
 
-    # Locate the email input field and fill it with your email
-    wait = WebDriverWait(driver, 10)
-    wait.until(ec.presence_of_element_located((By.ID, "username")))
-    email_input = driver.find_element(By.ID, "username")
-    email_input.send_keys(cbm_username)
 
-    # Locate the password input field and fill it with your password
-    password_input = driver.find_element(By.ID, "password")
-    password_input.send_keys(cbm_password)
+# Names of every checked entry in the student list, used to tell when a newly selected grade group has loaded
+def checked_student_names(driver):
+    return [student.text.strip() for student in driver.find_elements(By.CLASS_NAME, "checked")]
 
-    # Click the login button
-    sign_in_button = driver.find_element(By.CSS_SELECTOR, "button[type='submit']")
-    sign_in_button.click()
 
-    try:
-        wait = WebDriverWait(driver, 10)
-        logout_button = wait.until(ec.element_to_be_clickable((By.CSS_SELECTOR,
-                                                               "a[href='/teachers/logout.php']")))
-        if logout_button:
-            print("login successful")
+# Collect grade level data for separating students into groups, using the session that is already logged in
+def get_grade_levels(driver, recorder=None):
 
-    except (TimeoutException, NoSuchElementException):
-        print("ERROR: invalid login. Please re-enter your login credentials")
-        driver.quit()
+    print("Obtaining student grade-level information... ")
 
     try:
-        page = f"https://app.easycbm.com/teachers/auth/students.php"
-        # create page driver
-        driver.maximize_window()
+        page = site_url("/teachers/auth/students.php")
         driver.get(page)
     except WebDriverException:
         print(f"Error: Failed to load data from student grade levels table")
 
     grade_levels_dict = {}  # Initialize an empty dictionary
 
+    wait = WebDriverWait(driver, 10, poll_frequency=0.1, ignored_exceptions=[StaleElementReferenceException])
+    wait.until(ec.presence_of_element_located((By.CSS_SELECTOR, '[name="active-group"]')))
+
     grade_level_rows = driver.find_elements(By.CSS_SELECTOR, '[name="active-group"]')
     for item in grade_level_rows:
         label = driver.execute_script("return arguments[0].nextSibling.textContent.trim();", item)
         if label != "All Students":
+            previous_names = checked_student_names(driver)
             item.click()  # Click the grade level to load the students
-            grade_level_students = driver.find_elements(By.CLASS_NAME, "checked")
+
+            # Wait for the student list to switch to this grade level instead of sleeping a fixed time
+            try:
+                wait.until(lambda d: checked_student_names(d) != previous_names)
+            except TimeoutException:
+                print(f"Warning: student list did not change after selecting {label}")
+
+            checked_names = checked_student_names(driver)
+            record_grade_level(recorder, label, checked_names)
+
             students_list = []  # Initialize list to store student names
-            for student in grade_level_students:
-                student_name = student.text.strip()
+            for student_name in checked_names:
                 if student_name != label:  # Filter out the grade level label from student names
                     students_list.append(student_name)
 
             grade_levels_dict[label] = students_list  # Assign list of names to the grade level key
             print(f"{label}: {students_list}")  # Optionally print each grade and its students
 
-            time.sleep(1)  # Wait to avoid overwhelming the server or being detected as a bot
-
-    driver.quit()
-
     with open(os.path.join(Path.cwd().parent, "grade_levels_dict.json"), "w") as f:
         json.dump(grade_levels_dict, f, indent=4)
 
@@ -1,14 +1,92 @@
 import os
-import glob
+import time
+import shutil
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import numpy as np
 import pandas as pd
 from pathlib import Path
+from frame_storage_functions import frame_path, find_frame, is_frame_file, read_frame, save_frame, write_frame
+from frame_storage_functions import CSV_DATE_FORMAT
+from incremental_run_functions import hash_files, hash_frame, hash_frame_rows, hash_object
+from incremental_run_functions import stage_is_current, record_stage
+from test_date_file_functions import newest_test_date_file
 
 
-# Reformatting names in student table for matching in test table
-def shuffle_names(student_name):
+# Reformatting roster names into the "First L" form used in the 'Student Names, Incorrect' column. Everything before
+# the comma is the last name and everything after it the first name, so multi-part names keep their full first name
+def first_name_last_initial(student_name):
 
-    last_name, first_name = student_name.split(',')
-    return f'{first_name} {last_name}'
+    if ',' in student_name:
+        last_name, first_name = student_name.split(',', 1)
+    else:
+        first_name, _, last_name = student_name.strip().rpartition(' ')
+    return f"{' '.join(first_name.split())} {last_name.strip()[0]}"
+
+
+# Normalize a "First L" name key so roster keys and keys parsed from the incorrect names column compare exactly
+def normalize_name_key(name_key):
+    return ' '.join(name_key.split()).rstrip('.').casefold()
+
+
+# Index each roster name key to the student rows that share it. Keys shared by more than one student are returned
+# as collisions, since their missed items cannot be told apart
+def build_name_index(name_keys):
+    name_index = {}
+    for row, key in enumerate(name_keys):
+        name_index.setdefault(normalize_name_key(key), []).append(row)
+    collisions = {key: rows for key, rows in name_index.items() if len(rows) > 1}
+
+    return name_index, collisions
+
+
+# Build a student x item matrix flagging every item each student answered incorrectly. Each incorrect names cell is
+# split once into exact name keys that are looked up in the roster index, so "Ann S" never matches "Joann S". Entries
+# that are not a single key (e.g. names run together without commas) fall back to finding each roster key inside
+# them, as the original matching did, and are returned with the entries that match no student at all
+def build_incorrect_matrix(incorrect_names, name_keys, name_index=None):
+    if name_index is None:
+        name_index, _ = build_name_index(name_keys)
+
+    tokens = incorrect_names.fillna('').astype(str).reset_index(drop=True).str.split(r'[,;\n]', regex=True).explode()
+
+    incorrect_matrix = np.zeros((len(name_keys), len(incorrect_names)), dtype=bool)
+    substring_tokens = []
+    unmatched_tokens = []
+    for item, token in zip(tokens.index, tokens):
+        token = ' '.join(token.split())
+        if not token:
+            continue
+        rows = name_index.get(normalize_name_key(token))
+        if not rows:
+            rows = [row for row, key in enumerate(name_keys) if key in token]
+            (substring_tokens if rows else unmatched_tokens).append(token)
+        if rows:
+            incorrect_matrix[rows, item] = True
+
+    return incorrect_matrix, substring_tokens, unmatched_tokens
+
+
+# Reduce the student x item matrix to per-category accuracy and item counts for every student at once
+def category_accuracy_matrix(incorrect_matrix, item_categories, categories):
+    # One-hot item x category membership; items with a missing category belong to no column
+    category_index = {f'{category}': idx for idx, category in enumerate(categories) if pd.notna(category)}
+    item_codes = np.array([category_index.get(f'{category}', -1) if pd.notna(category) else -1
+                           for category in item_categories])
+    membership = (item_codes[:, None] == np.arange(len(categories))[None, :]).astype(np.int64)
+
+    item_counts = membership.sum(axis=0)
+    if (item_counts == 0).any():
+        raise ZeroDivisionError("category with no test items")
+
+    missed_counts = incorrect_matrix.astype(np.int64) @ membership
+    ratios = (item_counts - missed_counts) / item_counts
+
+    # Round through the same int(round(x, 2) * 100) expression as the original per-student loop so scores match
+    unique_ratios, inverse = np.unique(ratios, return_inverse=True)
+    percents = np.array([int(round(ratio, 2) * 100) for ratio in unique_ratios.tolist()], dtype=np.int64)
+    accuracies = percents[inverse].reshape(ratios.shape)
+
+    return accuracies, item_counts
 
 
 # Helper function for get_category_scores
@@ -20,21 +98,34 @@ def cat_score_column_creator(test_frame, admin_username, student_frame, test_, c
     item_count_headings = [f"{category} Item Count" for category in categories]
     columns = [item for pair in zip(categories, item_count_headings) for item in pair]
 
+    students = list(student_frame['Student Name'])
+    if not students:
+        return columns, student_rows
+
     try:
-        for student in student_frame['Student Name']:
+        name_keys = [first_name_last_initial(student) for student in students]
+        name_index, collisions = build_name_index(name_keys)
+        for key, rows in collisions.items():
+            print(f"WARNING: {[students[row] for row in rows]} share the name '{name_keys[rows[0]]}' in {test_}; "
+                  f"items missed by any of them are counted as missed by all of them")
+        incorrect_matrix, substring_tokens, unmatched_tokens = build_incorrect_matrix(
+            test_frame['Student Names, Incorrect'], name_keys, name_index)
+        if substring_tokens:
+            print(f"WARNING: {len(substring_tokens)} entries in the incorrect names column of {test_} are not single "
+                  f"'First L' names (e.g. '{substring_tokens[0]}'); students were matched by their name anywhere in "
+                  f"the entry")
+        if unmatched_tokens:
+            print(f"WARNING: {len(unmatched_tokens)} entries in the incorrect names column of {test_} match no "
+                  f"student in the student table (e.g. '{unmatched_tokens[0]}'); those missed items are not counted "
+                  f"against anyone")
+        accuracies, item_counts = category_accuracy_matrix(incorrect_matrix, test_frame[cat_header], categories)
+
+        # Interleave accuracy and item count per category to line up with the column headings
+        for student, student_accuracies in zip(students, accuracies.tolist()):
             student_row = [f'{student}', f'{admin_username}', f'{test_}']
-            name = shuffle_names(student)
-            first_last = name.split(' ')
-            first_name_last_init = first_last[1] + ' ' + first_last[2][0]
-            for category in categories:
-                filtered_for_cat = test_frame.loc[test_frame[cat_header] == f'{category}']
-                # filtering frame by student name appearance in Student Name, Incorrect column
-                name_mask = filtered_for_cat['Student Names, Incorrect'].str.contains(f'{first_name_last_init}')
-                filtered_for_cat_and_name = filtered_for_cat.loc[name_mask]
-                cat_accuracy = int(round((len(filtered_for_cat) - len(filtered_for_cat_and_name)) /
-                                         len(filtered_for_cat), 2) * 100)
+            for cat_accuracy, item_count in zip(student_accuracies, item_counts.tolist()):
                 student_row.append(cat_accuracy)
-                student_row.append(len(filtered_for_cat))
+                student_row.append(item_count)
             student_rows.append(student_row)
     except ZeroDivisionError:
         print(f"ERROR: {cat_header} data missing from {test_} file. Please check the file in the \n"
@@ -44,8 +135,48 @@ def cat_score_column_creator(test_frame, admin_username, student_frame, test_, c
     return columns, student_rows
 
 
+# Paths of the item analysis and student score files scraped for a single test
+def extracted_table_paths(username, test):
+    extracted_folder = os.path.join(Path.cwd().parent, 'Extracted Data Frames', f"{username}")
+    test_table_path = find_frame(extracted_folder, f'{username}_{test}_test_data')
+    student_table_path = find_frame(extracted_folder, f'{username}_{test}_student_data')
+    return test_table_path, student_table_path
+
+
+# Build the scores-by-category frame for a single test from its scraped files
+def build_category_frame(username, test):
+
+    print(f"Creating scores-by-category frame for {test}")
+
+    test_table_path, student_table_path = extracted_table_paths(username, test)
+    # Reading only the columns used for scoring
+    test_table = read_frame(test_table_path, columns=['Type', 'Student Names, Incorrect'])
+    student_table = read_frame(student_table_path, columns=['Student Name', 'Score'])
+
+    columns, student_rows = cat_score_column_creator(test_table, username, student_table, test, 'Type')
+
+    # Creating headers for processed data frame
+    headers = ['Student Name', 'Administrator', 'Test']
+    for col in columns:
+        headers.append(f'{col}')
+
+    # Creating data frame
+    processed_frame = pd.DataFrame(data=student_rows, columns=headers)
+    processed_frame['Overall Score'] = student_table['Score']
+
+    return processed_frame
+
+
+# Create the scores-by-category file for a single test; runs in a worker process when scoring in parallel
+def score_single_test(username, test, test_frame_folder):
+    processed_frame = build_category_frame(username, test)
+
+    # Writing data frame in the configured intermediate format
+    return write_frame(processed_frame, test_frame_folder, f'{username}_{test}')
+
+
 # Create files for student accuracy by question type
-def get_category_scores(username, test_list):
+def get_category_scores(username, test_list, parallel=False, max_workers=None, manifest=None):
 
     # Create directory for processed files
     print('Creating destination directory for category information files')
@@ -56,67 +187,129 @@ def get_category_scores(username, test_list):
     else:
         print("Directory already exists")
 
+    # Skip tests whose scraped files are unchanged since their scores were last written
+    input_hashes = {}
+    tests_to_score = []
     for test in test_list:
-
-        print(f"Creating scores-by-category file for {test}")
-
-        test_table_path = os.path.join(Path.cwd().parent, 'Extracted Data Frames', f"{username}",
-                                       f'{username}_{test}_test_data.csv')
-        student_table_path = os.path.join(Path.cwd().parent, 'Extracted Data Frames', f"{username}",
-                                          f'{username}_{test}_student_data.csv')
-        # Reading files
-        test_table = pd.read_csv(test_table_path)
-        student_table = pd.read_csv(student_table_path)
-
-        columns, student_rows = cat_score_column_creator(test_table, username, student_table, test, 'Type')
-
-        # Creating headers for processed data frame
-        headers = ['Student Name', 'Administrator', 'Test']
-        for col in columns:
-            headers.append(f'{col}')
-
-        # Creating data frame
-        processed_frame = pd.DataFrame(data=student_rows, columns=headers)
-        processed_frame['Overall Score'] = student_table['Score']
-
-        # Writing data frame to csv
-        path = os.path.join(test_frame_folder, f'{username}_{test}.csv')
-        processed_frame.to_csv(path, index=False)
+        input_hashes[test] = hash_files(extracted_table_paths(username, test))
+        output_path = frame_path(test_frame_folder, f'{username}_{test}')
+        if stage_is_current(manifest, f"get_category_scores/{username}/{test}", input_hashes[test], [output_path]):
+            print(f"Scores-by-category file for {test} is up to date")
+        else:
+            tests_to_score.append(test)
+
+    if not parallel:
+        for test in tests_to_score:
+            output_path = score_single_test(username, test, test_frame_folder)
+            record_stage(manifest, f"get_category_scores/{username}/{test}", input_hashes[test], [output_path])
+        return test_frame_folder
+
+    # Tests are independent of each other, so each one is scored in its own worker process
+    failed_tests = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(score_single_test, username, test, test_frame_folder): test
+                   for test in tests_to_score}
+        for future in as_completed(futures):
+            test = futures[future]
+            try:
+                output_path = future.result()
+                record_stage(manifest, f"get_category_scores/{username}/{test}", input_hashes[test], [output_path])
+            except Exception as e:
+                print(f"ERROR: Failed to create scores-by-category file for {test}: {e}")
+                failed_tests[test] = e
+
+    # Surface the first failure once every test has been attempted so callers can still retry on errors
+    if failed_tests:
+        print(f"Scores-by-category files failed for {len(failed_tests)} of {len(tests_to_score)} tests: "
+              f"{list(failed_tests)}")
+        raise next(iter(failed_tests.values()))
 
     return test_frame_folder
 
 
 # Combine all category score files for a single user into a single file
-def combine_csv_files(username, input_folder_path, output_folder_path):
+def combine_csv_files(username, input_folder_path, output_folder_path, manifest=None):
+    input_paths = [os.path.join(input_folder_path, filename) for filename in sorted(os.listdir(input_folder_path))
+                   if filename.startswith(f"{username}") and is_frame_file(filename)]
+    output_path = frame_path(output_folder_path, f"{username}_combined_df")
+
+    # Reuse the combined file if none of the single test files changed since it was written
+    input_hashes = hash_files(input_paths)
+    if stage_is_current(manifest, f"combine_csv_files/{username}", input_hashes, [output_path]):
+        print(f"Combined file for {username} is up to date")
+        return read_frame(output_path)
+
     # List to hold dataframes
     dfs = []
 
     # Loop through all files in the folder
-    for filename in os.listdir(input_folder_path):
-        if filename.startswith(f"{username}"):
-            # Construct full file path
-            file_path = os.path.join(input_folder_path, filename)
-            # Read the CSV file and append to the list
-            df = pd.read_csv(file_path)
-            dfs.append(df)
+    for file_path in input_paths:
+        # Read the frame file and append to the list
+        df = read_frame(file_path)
+        dfs.append(df)
 
     # Concatenate all dataframes into one
     combined_df = pd.concat(dfs, ignore_index=True)
 
-    combined_df.to_csv(os.path.join(output_folder_path, f"{username}_combined_df.csv"), index=False)
+    save_frame(combined_df, output_path)
+    record_stage(manifest, f"combine_csv_files/{username}", input_hashes, [output_path])
 
     return combined_df
 
 
+# Reshape the wide All_Students test date columns into long (student, test, date) rows indexed for joining
+def melt_test_dates(date_frame, test_names):
+    date_columns = [test_name for test_name in test_names if test_name in date_frame.columns]
+
+    # Keep the first row for each student, matching the first-match lookup used for duplicate names
+    unique_students = date_frame.drop_duplicates(subset='full name', keep='first')
+    long_dates = unique_students.melt(id_vars='full name', value_vars=date_columns, var_name='test',
+                                      value_name='test date')
+
+    return long_dates.set_index(['full name', 'test'])['test date']
+
+
 # Add test date data to combined frames to help with visualizations
-def add_date_data(input_folder, username):
+def add_date_data(input_folder, username, manifest=None):
+    file_path_1 = find_frame(input_folder, f"{username}_combined_df")
+    file_path_2 = newest_test_date_file(input_folder)
+
+    output_folder = os.path.join(os.path.dirname(input_folder), "Combined Data Frames With Dates")
+    path = frame_path(output_folder, f"{username}_with_dates")
+
+    # Skip the date join if neither the combined file nor the date file changed since the last run
+    input_hashes = hash_files([file_path_1, file_path_2])
+    if stage_is_current(manifest, f"add_date_data/{username}", input_hashes, [path]):
+        print(f"Dated file for {username} is up to date")
+        return output_folder
+
     # Load the datasets
-    file_path_1 = os.path.join(input_folder, f"{username}_combined_df.csv")
-    data = pd.read_csv(file_path_1)
-    date_file_paths = glob.glob(os.path.join(input_folder, "All_Students*"))
-    file_path_2 = date_file_paths[0]
-    data_2 = pd.read_csv(file_path_2)
+    data = read_frame(file_path_1)
+    data_2 = read_test_date_file(file_path_2)
+
+    data = attach_test_dates(data, data_2)
+
+    print('Creating destination directory for processed files')
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+        print("Directory created.")
+    else:
+        print("Directory already exists.")
+
+    # Save the updated dataset to a new CSV file
+    save_frame(data, path)
+    record_stage(manifest, f"add_date_data/{username}", input_hashes, [path])
 
+    return output_folder
+
+
+# Read the All_Students download, keeping only the name and test date columns
+def read_test_date_file(file_path):
+    return pd.read_csv(file_path, usecols=lambda col: col in ('Last Name', 'First Name') or col.endswith(' - Date'))
+
+
+# Attach each row's test date from the All_Students date frame to a combined scores frame
+def attach_test_dates(data, data_2):
     # Normalize student names for matching
     data['Student Name'] = data['Student Name'].str.strip().str.lower()
     data_2['Full Name'] = (data_2['Last Name'].str.strip().str.lower() + ', ' +
@@ -148,58 +341,68 @@ def add_date_data(input_folder, username):
     if 'full name' not in data_2.columns:
         raise KeyError("'Full Name' column is missing after preprocessing!")
 
-    # Create the test_date_mapping dictionary using exact matching
-    test_date_mapping = {test_name: test_name for test_name in data['Test'].unique() if test_name in data_2.columns}
+    # Reshape the date file to one (student, test) -> date row per test column present in the combined frame
+    test_dates = melt_test_dates(data_2, data['Test'].unique())
 
-    # Reset the 'Test Date' column in the first dataset
-    data['Test Date'] = None
+    # Attach every test date with a single indexed lookup on exact student name and test name
+    row_keys = pd.MultiIndex.from_arrays([data['Student Name'], data['Test']])
+    data['Test Date'] = test_dates.reindex(row_keys).to_numpy()
 
-    # Populate 'Test Date' column based on exact matching for student names and test names
-    for index, row in data.iterrows():
-        student_name = row['Student Name']
-        test_type = row['Test']
-        date_column = test_date_mapping.get(test_type)
+    # Parse dates once here so typed formats carry them downstream without re-parsing; csv files write them back in
+    # the site's MM/DD/YYYY form
+    raw_dates = data['Test Date']
+    data['Test Date'] = pd.to_datetime(raw_dates, errors='coerce')
+    unparsed_dates = raw_dates[raw_dates.notna() & data['Test Date'].isna()]
+    if not unparsed_dates.empty:
+        print(f"WARNING: {len(unparsed_dates)} test dates could not be read as dates (e.g. '{unparsed_dates.iloc[0]}') "
+              f"and were left blank")
 
-        if date_column:
-            matching_row = data_2[data_2['full name'] == student_name]
-            if not matching_row.empty:
-                data.at[index, 'Test Date'] = matching_row[date_column].values[0]
+    unmatched_rows = int((~row_keys.isin(test_dates.index)).sum())
+    print(f"Test dates matched for {len(data) - unmatched_rows} of {len(data)} rows "
+          f"({unmatched_rows} rows without a matching student and test date column)")
 
     # Display the first few rows of the updated dataset to verify
     print(data.head())
 
-    print('Creating destination directory for processed files')
-    output_folder = os.path.join(os.path.dirname(input_folder), "Combined Data Frames With Dates")
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
-        print("Directory created.")
-    else:
-        print("Directory already exists.")
-
-    # Save the updated dataset to a new CSV file
-    path = os.path.join(output_folder, f"{username}_with_dates.csv")
-    data.to_csv(path, index=False)
-
-    return output_folder
+    return data
 
 
 # Combine all final processed files by user into a single frame from which to create student and class files
-def combine_big_frames(input_folder_path, grade_levels):
+def combine_big_frames(input_folder_path, grade_levels, manifest=None):
+    input_paths = [os.path.join(input_folder_path, filename) for filename in sorted(os.listdir(input_folder_path))
+                   if is_frame_file(filename)]
+    output_path = frame_path(Path.cwd().parent, "BIG_DF")
+
+    # Reuse BIG_DF if the dated files and the grade level assignments are unchanged
+    input_hashes = hash_files(input_paths)
+    input_hashes["grade_levels"] = hash_object(grade_levels)
+    if stage_is_current(manifest, "combine_big_frames", input_hashes, [output_path]):
+        print("BIG_DF is up to date")
+        return apply_big_frame_schema(read_frame(output_path))
+
     # List to hold dataframes
     dfs = []
 
     # Loop through all files in the folder
-    for filename in os.listdir(input_folder_path):
-        if filename.endswith(".csv"):
-            # Construct full file path
-            file_path = os.path.join(input_folder_path, filename)
-            # Read the CSV file and append to the list
-            df = pd.read_csv(file_path)
-            dfs.append(df)
+    for file_path in input_paths:
+        # Read the frame file and append to the list
+        df = read_frame(file_path)
+        dfs.append(df)
 
     # Concatenate all dataframes into one
-    combined_df = pd.concat(dfs, ignore_index=True)
+    combined_df = apply_big_frame_schema(assign_grade_levels(pd.concat(dfs, ignore_index=True), grade_levels))
+
+    save_frame(combined_df, output_path)
+    record_stage(manifest, "combine_big_frames", input_hashes, [output_path])
+
+    # Debug: print sample of combined_df to verify
+    print(combined_df.head())
+
+    return combined_df
+
 
+# Add each student's current grade level to the combined frame, marking unlisted students as former students
+def assign_grade_levels(combined_df, grade_levels):
     # Create a reverse lookup dictionary from grade_levels
     student_to_grade = {}
     for grade, students in grade_levels.items():
@@ -223,16 +426,136 @@ def combine_big_frames(input_folder_path, grade_levels):
     # Map the normalized 'Student Name' to the 'Grade Level'
     combined_df['Grade Level'] = combined_df['Student Name'].apply(map_grade_level)
 
-    combined_df.to_csv(os.path.join(Path.cwd().parent, "BIG_DF.csv"), index=False)
+    return combined_df
 
-    # Debug: print sample of combined_df to verify
-    print(combined_df.head())
 
-    return combined_df
+# Identifier columns stored as categoricals, since each repeats a few distinct values across many rows
+BIG_DF_IDENTIFIER_COLUMNS = ['Student Name', 'Administrator', 'Test', 'Grade Level', 'Test Category']
+
+
+# Label each test as math, reading, or other, deciding once per distinct test name instead of once per row
+def test_categories(tests):
+    labels = {test: 'math' if 'math' in test else 'reading' if 'reading' in test else 'other'
+              for test in tests.dropna().unique()}
+    return tests.map(labels).astype('category')
+
+
+# Apply the compact BIG_DF schema: categorical identifiers, small integer item counts, float32 scores, and parsed
+# test dates, adding the derived 'Test Category' column
+def apply_big_frame_schema(big_df):
+    big_df['Test Category'] = test_categories(big_df['Test'])
+    for col in big_df.columns:
+        if col in BIG_DF_IDENTIFIER_COLUMNS:
+            big_df[col] = big_df[col].astype('category')
+        elif col == 'Test Date':
+            big_df[col] = pd.to_datetime(big_df[col])
+        elif col.endswith(' Item Count'):
+            big_df[col] = big_df[col].astype('UInt16')
+        elif pd.api.types.is_numeric_dtype(big_df[col]):
+            big_df[col] = big_df[col].astype('float32')
+
+    return big_df
+
+
+# Split a frame into one frame per group, ready to be written as its own file. Each group keeps only its non-empty
+# columns, with 'Overall Score' moved to the end. The frame is sorted by group once so each group is a plain slice,
+# and empty cells and row hashes are worked out once for the whole frame. Yields each group's key, rows, columns to
+# write, and content hash
+def group_file_frames(df, keys):
+    grouped = df.groupby(keys, observed=True)
+    group_numbers = grouped.ngroup().to_numpy()
+    # Rows with a missing key belong to no group; the stable sort keeps each group's rows in their original order
+    grouped_rows = np.flatnonzero(group_numbers >= 0)
+    sorted_df = df.take(grouped_rows[np.argsort(group_numbers[grouped_rows], kind='stable')])
+
+    not_empty = sorted_df.notna().to_numpy()
+    row_hashes = pd.util.hash_pandas_object(sorted_df, index=False).to_numpy()
+    score_position = sorted_df.columns.get_loc('Overall Score') if 'Overall Score' in sorted_df.columns else None
+
+    group_sizes = grouped.size()
+    group_ends = np.cumsum(group_sizes.to_numpy())
+    for key, end, size in zip(group_sizes.index, group_ends, group_sizes.to_numpy()):
+        start = end - size
+        # Remove columns where all entries are NaN
+        present = not_empty[start:end].any(axis=0)
+        cols = [col for position, col in enumerate(sorted_df.columns)
+                if present[position] and position != score_position]
+        # Ensure "Overall Score" is the last column if it has any entries
+        if score_position is not None and present[score_position]:
+            cols.append('Overall Score')
+
+        yield key, sorted_df.iloc[start:end], cols, hash_frame_rows(cols, row_hashes[start:end])
+
+
+# Write (frame, columns) pairs to their csv paths through a bounded thread pool, since the writes are I/O-bound.
+# Returns the paths written and the paths that failed with their errors
+def write_csv_files(frames_by_path, max_workers=8):
+    written_paths = []
+    failed_paths = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(frame.to_csv, path, index=False, columns=cols, date_format=CSV_DATE_FORMAT): path
+                   for path, (frame, cols) in frames_by_path.items()}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                future.result()
+                written_paths.append(path)
+            except Exception as e:
+                print(f"ERROR: Failed to save {path}: {e}")
+                failed_paths[path] = e
+
+    return written_paths, failed_paths
+
+
+# Write text already rendered in memory to each path through a bounded thread pool, like write_csv_files.
+# Returns the paths written and the paths that failed with their errors
+def write_text_files(texts_by_path, max_workers=8):
+    def write_text(path, text):
+        with open(path, 'w') as f:
+            f.write(text)
+
+    written_paths = []
+    failed_paths = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(write_text, path, text): path for path, text in texts_by_path.items()}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                future.result()
+                written_paths.append(path)
+            except Exception as e:
+                print(f"ERROR: Failed to save {path}: {e}")
+                failed_paths[path] = e
+
+    return written_paths, failed_paths
+
+
+# Save every student's rows as one Parquet dataset partitioned by grade level and test category (requires pyarrow).
+# The student chart and recommendation stages need the per-student csv files, so the dataset cannot feed them
+def save_student_dataset(df):
+    output_folder = os.path.join(Path.cwd().parent, "Student Dataset")
+    # Partitioned writes add files to existing partitions, so the previous dataset is replaced
+    if os.path.exists(output_folder):
+        shutil.rmtree(output_folder)
+    df.to_parquet(output_folder, partition_cols=['Grade Level', 'Test Category'], index=False)
+    print(f"Student dataset saved: {output_folder}")
+
+    return output_folder
+
+
+# Group and save all student data into individual files, written by a pool of max_workers threads.
+# partitioned=True saves a single partitioned dataset instead of one file per student, for use outside the pipeline;
+# the returned dataset folder cannot be passed to create_all_student_charts or create_district_student_recommendations
+def save_files_by_student(big_df, manifest=None, max_workers=8, partitioned=False):
+    df = big_df
 
+    # 'Test Category' (math or reading) comes with the BIG_DF schema; frames without it get it here
+    if 'Test Category' not in df.columns:
+        df['Test Category'] = test_categories(df['Test'])
+
+    if partitioned:
+        return save_student_dataset(df)
 
-# Group and save all student data into individual files
-def save_files_by_student(big_df):
     print('Creating destination directory for student information files')
     output_folder = (os.path.join(Path.cwd().parent, "Student Data Frames"))
     if not os.path.exists(output_folder):
@@ -241,39 +564,40 @@ def save_files_by_student(big_df):
     else:
         print("Directory already exists")
 
-    df = big_df
-
-    # Group by 'Student Name' and test type and write to CSV
-    # Add a new column to categorize test type based on the presence of "Math" or "Reading"
-    df['Test Category'] = df['Test'].apply(
-        lambda x: 'math' if 'math' in x else 'reading' if 'reading' in x else 'other')
-
-    for (name, category, grade), group in df.groupby(['Student Name', 'Test Category', 'Grade Level']):
-        # Reset the index and drop the previous index entirely to avoid it being added as a column
-        group = group.reset_index(drop=True)
-
-        # Remove columns where all entries are NaN
-        group = group.dropna(axis=1, how='all')
-
-        # Ensure "Overall Score" is the last column if it exists in the DataFrame
-        if 'Overall Score' in group.columns:
-            # Move "Overall Score" to the end
-            cols = [col for col in group.columns if col != 'Overall Score'] + ['Overall Score']
-            group = group[cols]
+    start_time = time.perf_counter()
+    frames_by_path = {}
+    input_hashes = {}
+    unchanged_files = 0
 
+    # Group by 'Student Name' and test type, preparing every changed file before any are written
+    for (name, category, grade), group, cols, group_hash in group_file_frames(df, ['Student Name', 'Test Category',
+                                                                                   'Grade Level']):
         # Create a valid filename for each student
         filename = f"{name.replace(' ', '_')}_{category}.csv"
         filepath = os.path.join(output_folder, filename)
 
-        # Save the DataFrame to CSV without including the index
-        group.to_csv(filepath, index=False)
-        print(f"File saved: {filepath}")
+        # Only rewrite files whose group contents changed since the last run
+        input_hashes[filepath] = {"frame": group_hash}
+        if stage_is_current(manifest, f"save_files_by_student/{filename}", input_hashes[filepath], [filepath]):
+            unchanged_files += 1
+            continue
+        frames_by_path[filepath] = (group, cols)
+
+    written_paths, failed_paths = write_csv_files(frames_by_path, max_workers)
+    for filepath in written_paths:
+        record_stage(manifest, f"save_files_by_student/{os.path.basename(filepath)}", input_hashes[filepath],
+                     [filepath])
+
+    print(f"Student files saved: {len(written_paths)} written, {unchanged_files} unchanged, {len(failed_paths)} "
+          f"failed in {time.perf_counter() - start_time:.2f} sec")
+    if failed_paths:
+        raise next(iter(failed_paths.values()))
 
     return output_folder
 
 
 # Group and save all student data by class
-def save_files_by_class(big_df):
+def save_files_by_class(big_df, manifest=None):
     print('Creating destination directory for class information files')
     output_folder = (os.path.join(Path.cwd().parent, "Class Data Frames"))
     if not os.path.exists(output_folder):
@@ -285,11 +609,11 @@ def save_files_by_class(big_df):
     df = big_df
 
     # Group by 'Student Name' and test type and write to CSV
-    # Add a new column to categorize test type based on the presence of "Math" or "Reading"
-    df['Test Category'] = df['Test'].apply(
-        lambda x: 'math' if 'math' in x else 'reading' if 'reading' in x else 'other')
+    # 'Test Category' (math or reading) comes with the BIG_DF schema; frames without it get it here
+    if 'Test Category' not in df.columns:
+        df['Test Category'] = test_categories(df['Test'])
 
-    for (grade_level, category), group in df.groupby(['Grade Level', 'Test Category']):
+    for (grade_level, category), group in df.groupby(['Grade Level', 'Test Category'], observed=True):
         # Reset the index and drop the previous index entirely to avoid it being added as a column
         group = group.reset_index(drop=True)
 
@@ -306,8 +630,14 @@ def save_files_by_class(big_df):
         filename = f"{grade_level.replace(' ', '_')}_{category}.csv"
         filepath = os.path.join(output_folder, filename)
 
+        # Only rewrite files whose group contents changed since the last run
+        input_hashes = {"frame": hash_frame(group)}
+        if stage_is_current(manifest, f"save_files_by_class/{filename}", input_hashes, [filepath]):
+            continue
+
         # Save the DataFrame to CSV without including the index
-        group.to_csv(filepath, index=False)
+        group.to_csv(filepath, index=False, date_format=CSV_DATE_FORMAT)
+        record_stage(manifest, f"save_files_by_class/{filename}", input_hashes, [filepath])
         print(f"File saved: {filepath}")
 
     return output_folder
@@ -1,6 +1,93 @@
+import numpy as np
 import pandas as pd
 from pathlib import Path
 import os
+import time
+import shutil
+from parsed_frame_functions import read_parsed_frame, test_group_values
+from data_cleaning_functions import test_categories, write_text_files
+
+
+# Columns BIG_DF is split by into student files, as in save_files_by_student
+STUDENT_FILE_KEYS = ['Student Name', 'Test Category', 'Grade Level']
+
+
+# Format a category's test date range, or "N/A" if no test with items in that category has a date
+def format_date_range(first_date, last_date):
+    if pd.isna(first_date) or pd.isna(last_date):
+        return "N/A"
+    return f"{pd.Timestamp(first_date).strftime('%m/%d/%Y')} - {pd.Timestamp(last_date).strftime('%m/%d/%Y')}"
+
+
+# Order ranking values highest first with missing values last, breaking ties exactly as
+# sort_values(ascending=False) does so rankings match the per-test frames they replace
+def descending_order(values):
+    not_missing = np.flatnonzero(~np.isnan(values))[::-1]
+    order = not_missing[values[not_missing].argsort(kind='quicksort')][::-1]
+    return np.concatenate([order, np.flatnonzero(np.isnan(values))])
+
+
+# Rank the question types of every group (a test, or a student's test year) in one grouped pass. Each category gets
+# its average score, its item count combined with item_count_aggregate, a ranking value of (100 - average score) x
+# item count replaced by its dense rank, and the range of test dates with items in that category. Categories marked
+# False in available_categories (groups x categories) are left out of that group's ranking. Returns each group's
+# top 3 categories, with the groups in the order given
+def rank_question_types(data, group_column, groups, categories, item_count_aggregate='mean', round_scores=False,
+                        available_categories=None):
+    columns = ['Category', 'Average Score', 'Item Count', 'Ranking Value', 'Test Date Range', group_column]
+    if not len(groups) or not categories:
+        return pd.DataFrame(columns=columns)
+
+    item_count_cols = [f"{category} Item Count" for category in categories]
+    grouped = data.groupby(group_column, sort=False)
+
+    # Calculate average scores and item counts for all categories of every group at once
+    average_scores = grouped[categories].mean().reindex(groups)
+    if round_scores:
+        average_scores = average_scores.round(1)
+    item_counts = grouped[item_count_cols].agg(item_count_aggregate).reindex(groups).to_numpy(dtype=float)
+    average_scores = average_scores.to_numpy(dtype=float)
+    ranking_values = (100 - average_scores) * item_counts
+
+    # Test date range of each category, from the rows that have items in that category
+    category_dates = pd.DataFrame({category: data['Test Date'].where(data[item_count_col].notnull())
+                                   for category, item_count_col in zip(categories, item_count_cols)})
+    category_dates[group_column] = data[group_column]
+    grouped_dates = category_dates.groupby(group_column, sort=False)
+    first_dates = grouped_dates[categories].min().reindex(groups).to_numpy().ravel()
+    last_dates = grouped_dates[categories].max().reindex(groups).to_numpy().ravel()
+
+    # One row per (group, category), in group order and then category order
+    ranking_df = pd.DataFrame({
+        'Category': np.tile(categories, len(groups)),
+        'Average Score': average_scores.ravel(),
+        'Item Count': item_counts.ravel(),
+        'Ranking Value': ranking_values.ravel(),
+        group_column: np.repeat(np.asarray(groups, dtype=object), len(categories)),
+    })
+
+    # Sort each group by ranking value, highest first with missing values last
+    if available_categories is None:
+        available_categories = np.ones(ranking_values.shape, dtype=bool)
+    order = []
+    for position, (group_ranking_values, available) in enumerate(zip(ranking_values, available_categories)):
+        available = np.flatnonzero(available)
+        order.append(position * len(categories) + available[descending_order(group_ranking_values[available])])
+    order = np.concatenate(order)
+    ranking_df = ranking_df.iloc[order]
+    first_dates, last_dates = first_dates[order], last_dates[order]
+
+    # Replace 'Ranking Value' with integer dense ranks, with 0 for categories that could not be ranked
+    ranking_df['Ranking Value'] = ranking_df.groupby(group_column, sort=False)['Ranking Value'].rank(
+        method='dense', ascending=False).fillna(0).astype(int)
+
+    # Select the top 3 categories of each group
+    top_3 = (ranking_df.groupby(group_column, sort=False).cumcount() < 3).to_numpy()
+    top_3_ranking_df = ranking_df[top_3].copy()
+    top_3_ranking_df['Test Date Range'] = [format_date_range(first_date, last_date) for first_date, last_date
+                                           in zip(first_dates[top_3], last_dates[top_3])]
+
+    return top_3_ranking_df[columns].reset_index(drop=True)
 
 
 # CLASS FILE PROCESSING FUNCTIONS
@@ -17,13 +104,14 @@ def process_file(file_path):
     else:
         grade_level = None
 
-    # Load the CSV file
-    data = pd.read_csv(file_path)
+    # Load the CSV file, reusing the parse from the class charts ('Test Date' is already converted to datetime)
+    parsed = read_parsed_frame(file_path)
+    data = parsed['frame'].copy()
 
     current_grade_level = data['Grade Level'].iloc[0]
 
     # Extract unique test groups based on the "Test" column, accounting for Kindergarten (K) and former_student
-    data['Test Group'] = data['Test'].str.extract(r'(\d+|k|former_student)', expand=False).replace('k', 'K')
+    data['Test Group'] = test_group_values(parsed, r'(\d+|k|former_student)').replace('k', 'K')
 
     if grade_level:
         data['Test Group'] = grade_level
@@ -39,110 +127,34 @@ def process_file(file_path):
     elif max_test_group == 0:
         max_test_group = 'K'
 
-    # Convert 'Test Date' to datetime for accurate range calculations
-    data['Test Date'] = pd.to_datetime(data['Test Date'], errors='coerce')
-
-    # Filter numeric columns only
-    numeric_data = data.select_dtypes(include='number')
-
-    # Extract all category names excluding 'Item Count' and 'Overall Score'
-    all_categories = [col for col in numeric_data.columns if 'Item Count' not in col and col != 'Overall Score']
-
-    # Initialize a DataFrame to collect all top 3 rankings
-    all_tests_ranking_df = pd.DataFrame()
-
     # Sort data by 'Test Date' in descending order
     data = data.sort_values(by='Test Date', ascending=False)
 
-    for test in data['Test'].unique():
-        test_data = data[data['Test'] == test]
-        test_numeric_data = test_data.select_dtypes(include='number')
-
-        # Calculate average scores for all categories
-        average_all_category_scores = round(test_numeric_data[all_categories].mean(), 1)
-
-        # Identify corresponding item count columns and filter only existing ones
-        all_item_count_cols = [f"{category} Item Count" for category in all_categories if
-                               f"{category} Item Count" in test_numeric_data.columns]
-        existing_categories = [category for category in all_categories if f"{category} Item Count" in test_numeric_data.columns]
-
-        # Calculate total item counts for the existing categories
-        all_item_counts = test_numeric_data[all_item_count_cols].mean()
-
-        # Calculate the ranking values using the specified formula
-        all_ranking_values = (100 - average_all_category_scores[existing_categories]) * all_item_counts.values
-
-        # Create a DataFrame for better readability
-        all_ranking_df = pd.DataFrame({
-            'Category': existing_categories,
-            'Average Score': average_all_category_scores[existing_categories].values,
-            'Item Count': all_item_counts.values,
-            'Ranking Value': all_ranking_values
-        })
-
-        # Sort by the ranking value
-        sorted_all_ranking_df = all_ranking_df.sort_values(by='Ranking Value', ascending=False)
+    # Only categories with an item count column can be ranked
+    existing_categories = [category for category in parsed['categories'] if f"{category} Item Count" in data.columns]
 
-        # Replace 'Ranking Value' with integer ranks
-        sorted_all_ranking_df['Ranking Value'] = sorted_all_ranking_df['Ranking Value'].rank(method='dense', ascending=False)
-
-        # Fill NaN values with 0 (or any other appropriate value) before converting to integers
-        sorted_all_ranking_df['Ranking Value'] = sorted_all_ranking_df['Ranking Value'].fillna(0).astype(int)
-
-        # Select top 3 categories
-        top_3_ranking_df = sorted_all_ranking_df.head(3).copy()
-
-        # Define a function to get correct date range, including the most recent date
-        def get_correct_date_range_with_latest(category):
-            item_count_col = f"{category} Item Count"
-            if item_count_col in test_data.columns:
-                relevant_rows = test_data[test_data[item_count_col].notnull()]
-                if not relevant_rows.empty:
-                    date_range = relevant_rows['Test Date'].min(), relevant_rows['Test Date'].max()
-                else:
-                    date_range = (None, None)
-            else:
-                date_range = (None, None)
-            return date_range
-
-        # Correctly calculate the test date ranges for each category
-        correct_test_date_ranges_with_latest = {category: get_correct_date_range_with_latest(category) for category in
-                                                top_3_ranking_df['Category']}
-
-        # Convert test date ranges to a readable format
-        correct_test_date_ranges_with_latest_str = {
-            k: f"{v[0].strftime('%m/%d/%Y')} - {v[1].strftime('%m/%d/%Y')}" if v[0] and v[1] else "N/A" for k, v in
-            correct_test_date_ranges_with_latest.items()}
-
-        # Add the correct test date ranges to the top 3 ranking dataframe using .loc
-        top_3_ranking_df.loc[:, 'Test Date Range'] = top_3_ranking_df['Category'].map(correct_test_date_ranges_with_latest_str)
-
-        # Add the test name to the DataFrame
-        top_3_ranking_df['Test'] = test
-
-        # Append to the all tests ranking DataFrame
-        all_tests_ranking_df = pd.concat([all_tests_ranking_df, top_3_ranking_df], ignore_index=True)
+    # Rank every test's categories in one pass, with tests in order of their most recent date
+    all_tests_ranking_df = rank_question_types(data, 'Test', list(data['Test'].unique()), existing_categories,
+                                               item_count_aggregate='mean', round_scores=True)
 
     # Check if all_tests_ranking_df is empty
     if not all_tests_ranking_df.empty:
         print(all_tests_ranking_df)  # Debugging: Print the DataFrame to check if 'Test' exists
 
-        # Append the rankings to the input CSV file
-        with open(file_path, 'a') as f:
-            f.write("\n\nTop 3 Question Types to Focus on, Grouped by Test:\n")
-            all_tests_ranking_df.to_csv(f, index=False)
-
     return all_tests_ranking_df, max_test_group, subject, current_grade_level
 
 
-# Helper function for saving all processed class files in directory
-def processed_file_destination(processed_file_path, grade_level, subject, current_grade_level):
-    processed_frame = pd.read_csv(processed_file_path)
+# Helper function for saving all processed class files in directory. The class file is copied unchanged and the top 3
+# question types per test are written from memory as their own table, so the class file is never appended to or reread
+def processed_file_destination(file_path, ranking_df, grade_level, subject, current_grade_level):
     file_folder = os.path.join(Path.cwd().parent, "Processed Frames by Class", f"{current_grade_level}",
                                f"{current_grade_level} {subject}")
     if not os.path.exists(file_folder):
         os.makedirs(file_folder)
-    processed_frame.to_csv(os.path.join(file_folder, f"Grade {grade_level} {subject} Scores and Recommendations.csv"))
+    shutil.copyfile(file_path, os.path.join(file_folder, f"Grade {grade_level} {subject} Scores.csv"))
+    ranking_df.to_csv(os.path.join(file_folder, f"Grade {grade_level} {subject} Recommendations.csv"), index=False)
+
+    return file_folder
 
 
 # Create recommendations for teachers on which areas to focus on moving forward for a given class
@@ -153,159 +165,98 @@ def create_class_question_type_recommendations(input_folder_path):
             file_path = os.path.join(input_folder_path, file_name)
             result_df, test_group, subject, current_grade_level = process_file(file_path)
             results.append((file_name, result_df))
-            processed_file_destination(file_path, test_group, subject, current_grade_level)
+            processed_file_destination(file_path, result_df, test_group, subject, current_grade_level)
     return results
 
 
 # STUDENT FILE PROCESSING FUNCTIONS
-# Helper function for processing all student files in the directory
-def process_student_file(file_path):
-
-    filename = os.path.basename(file_path)
-    print(f"PROCESSING FILE {filename}")  # debug print statement
-    name_parts = filename.split('_')
-    subject = name_parts[-1].split('.')[0]  # Ensure the subject is correctly extracted without the file extension
-    student_name = "_".join(name_parts[:-1])
-
-    # Load the CSV file
-    data = pd.read_csv(file_path)
-
-    current_grade_level = data['Grade Level'].iloc[0]
-
-    # Extract unique test groups based on the "Test" column, accounting for Kindergarten (K) and former_student
-    data['Test Group'] = data['Test'].str.extract(r'(\d+|k|former_student)', expand=False)
-
-    # Debugging print to check extracted groups
-    print("Extracted Test Groups:", data['Test Group'].unique())
-
-    # Convert 'Test Group' to string, replace values, and then convert back to integers
-    data['Test Group'] = data['Test Group'].replace({'k': '0', 'former_student': '-1'}).astype(int)
-    max_test_group = data['Test Group'].max()
-    if max_test_group == -1:
-        max_test_group = 'former_student'
-    elif max_test_group == 0:
-        max_test_group = 'K'
-
-    # Convert 'Test Date' to datetime for accurate range calculations
-    data['Test Date'] = pd.to_datetime(data['Test Date'], errors='coerce')
-
-    # Extract the test year from the 'Test' column
-    data['Test Year'] = data['Test'].str.extract(r'(\d+)', expand=False)
-
-    # Filter numeric columns only
-    numeric_data = data.select_dtypes(include='number')
-
-    # Extract all category names excluding 'Item Count' and 'Overall Score'
-    all_categories = [col for col in numeric_data.columns if 'Item Count' not in col and col != 'Overall Score']
-
-    # Initialize a DataFrame to collect all top 3 rankings
-    all_years_ranking_df = pd.DataFrame()
-
-    for year in sorted(data['Test Year'].unique(), reverse=True):  # Sort years in descending order
-        if pd.isna(year):
-            continue
-        year_data = data[data['Test Year'] == year]
-        year_numeric_data = year_data.select_dtypes(include='number')
-
-        # Calculate average scores for all categories
-        average_all_category_scores = year_numeric_data[all_categories].mean()
-
-        # Identify corresponding item count columns and filter only existing ones
-        all_item_count_cols = [f"{category} Item Count" for category in all_categories if
-                               f"{category} Item Count" in year_numeric_data.columns]
-        existing_categories = [category for category in all_categories if f"{category} Item Count" in year_numeric_data.columns]
-
-        # Calculate total item counts for the existing categories
-        all_item_counts = year_numeric_data[all_item_count_cols].sum()
-
-        # Calculate the ranking values using the specified formula
-        all_ranking_values = (100 - average_all_category_scores[existing_categories]) * all_item_counts.values
-
-        # Create a DataFrame for better readability
-        all_ranking_df = pd.DataFrame({
-            'Category': existing_categories,
-            'Average Score': average_all_category_scores[existing_categories].values,
-            'Item Count': all_item_counts.values,
-            'Ranking Value': all_ranking_values
-        })
-
-        # Sort by the ranking value
-        sorted_all_ranking_df = all_ranking_df.sort_values(by='Ranking Value', ascending=False)
-
-        # Replace 'Ranking Value' with integer ranks
-        sorted_all_ranking_df['Ranking Value'] = sorted_all_ranking_df['Ranking Value'].rank(method='dense', ascending=False)
-
-        # Fill NaN values with 0 (or any other appropriate value) before converting to integers
-        sorted_all_ranking_df['Ranking Value'] = sorted_all_ranking_df['Ranking Value'].fillna(0).astype(int)
-
-        # Select top 3 categories
-        top_3_ranking_df = sorted_all_ranking_df.head(3).copy()
-
-        # Define a function to get correct date range, including the most recent date
-        def get_correct_date_range_with_latest_by_student(category):
-            item_count_col = f"{category} Item Count"
-            if item_count_col in year_data.columns:
-                relevant_rows = year_data[year_data[item_count_col].notnull()]
-                if not relevant_rows.empty:
-                    date_range = relevant_rows['Test Date'].min(), relevant_rows['Test Date'].max()
-                else:
-                    date_range = (None, None)
-            else:
-                date_range = (None, None)
-            return date_range
-
-        # Correctly calculate the test date ranges for each category
-        correct_test_date_ranges_with_latest = {category: get_correct_date_range_with_latest_by_student(category) for category in
-                                                top_3_ranking_df['Category']}
-
-        # Convert test date ranges to a readable format
-        correct_test_date_ranges_with_latest_str = {
-            k: f"{v[0].strftime('%m/%d/%Y')} - {v[1].strftime('%m/%d/%Y')}" if v[0] and v[1] else "N/A" for k, v in
-            correct_test_date_ranges_with_latest.items()}
-
-        # Add the correct test date ranges to the top 3 ranking dataframe using .loc
-        top_3_ranking_df.loc[:, 'Test Date Range'] = top_3_ranking_df['Category'].map(correct_test_date_ranges_with_latest_str)
-
-        # Add the year to the DataFrame
-        top_3_ranking_df['Test Year'] = year
-
-        # Append to the all years ranking DataFrame
-        all_years_ranking_df = pd.concat([all_years_ranking_df, top_3_ranking_df], ignore_index=True)
-
-    # Check if all_years_ranking_df is empty
-    if not all_years_ranking_df.empty:
-        print(all_years_ranking_df)  # Debugging: Print the DataFrame to check if 'Test Year' exists
-
-        # Sort the final DataFrame by 'Test Year' in descending order
-        all_years_ranking_df = all_years_ranking_df.sort_values(by='Test Year', ascending=False)
-
-        # Append the rankings to the input CSV file
-        with open(file_path, 'a') as f:
-            f.write("\n\nTop 3 Areas to Focus on Grouped by Year:\n")
-            all_years_ranking_df.to_csv(f, index=False)
-
-    return all_years_ranking_df, max_test_group, subject, student_name, current_grade_level
-
-
-# Helper function for saving all processed student files in directory
-def processed_student_file_destination(processed_file_path, grade_level, subject, student_name, current_grade_level):
-    processed_frame = pd.read_csv(processed_file_path)
-    file_folder = os.path.join(Path.cwd().parent, "Processed Frames by Class", f"{current_grade_level}",
-                               f"{current_grade_level} {subject}", f"{student_name} {subject}")
-    if not os.path.exists(file_folder):
-        os.makedirs(file_folder)
-    processed_frame.to_csv(os.path.join(file_folder, f"{student_name} Grade {grade_level} {subject} "
-                                                     f"Scores and Recommendations.csv"))
-    return file_folder
-
-
-# Create recommendations for teachers on which areas to focus on moving forward for a given student
-def create_student_question_type_recommendations(input_folder_path):
-    results = []
-    for file_name in os.listdir(input_folder_path):
-        if file_name.endswith('.csv'):
-            file_path = os.path.join(input_folder_path, file_name)
-            result_df, test_group, subject, student_name, current_grade_level = process_student_file(file_path)
-            results.append((file_name, result_df))
-            processed_student_file_destination(file_path, test_group, subject, student_name, current_grade_level)
-    return results
+# Rank every student's question types for each test year straight from BIG_DF in one grouped pass, counting only the
+# categories in the student's file. Returns the top 3 per year with each student's key columns, in student order and
+# then descending year order and indexed by student, and each student's key columns with their highest test group
+def rank_student_question_types(big_df):
+    if 'Test Category' not in big_df.columns:
+        big_df['Test Category'] = test_categories(big_df['Test'])
+
+    # Number the students in the same order save_files_by_student writes their files; rows with a missing key
+    # belong to no student file
+    student_ids = big_df.groupby(STUDENT_FILE_KEYS, observed=True).ngroup().to_numpy()
+    rows = student_ids >= 0
+    student_ids = student_ids[rows]
+    first_rows = np.unique(student_ids, return_index=True)[1]
+    students = big_df.loc[rows, STUDENT_FILE_KEYS].iloc[first_rows].reset_index(drop=True)
+
+    # Only categories with an item count column can be ranked; scores and counts are ranked as float64, the way the
+    # student files read back
+    categories = [col for col in big_df.columns if f"{col} Item Count" in big_df.columns]
+    item_count_cols = [f"{category} Item Count" for category in categories]
+    data = big_df.loc[rows, categories + item_count_cols].astype(float)
+    data['Test Date'] = pd.to_datetime(big_df.loc[rows, 'Test Date'], errors='coerce')
+    tests = big_df.loc[rows, 'Test'].astype(str)
+
+    # Each student's highest test group, accounting for Kindergarten (K) and former_student
+    test_groups = tests.str.extract(r'(\d+|k|former_student)', expand=False)
+    test_groups = test_groups.replace({'k': '0', 'former_student': '-1'}).astype(int)
+    max_test_groups = test_groups.groupby(student_ids).max().to_numpy()
+    students['Max Test Group'] = [
+        'former_student' if test_group == -1 else 'K' if test_group == 0 else test_group
+        for test_group in max_test_groups.tolist()]
+
+    # One ranking group per student test year, with each student's years in descending order
+    years = tests.str.extract(r'(\d+)', expand=False).to_numpy()
+    has_year = pd.notna(years)
+    year_groups = pd.DataFrame({'Student': student_ids[has_year], 'Test Year': years[has_year]}).drop_duplicates()
+    year_groups = year_groups.sort_values(['Student', 'Test Year'], ascending=[True, False]).reset_index(drop=True)
+    data['Ranking Group'] = pd.MultiIndex.from_frame(year_groups).get_indexer(
+        pd.MultiIndex.from_arrays([student_ids, years]))
+
+    # A student's file only has the categories they were tested on
+    tested_categories = data[item_count_cols].notna().groupby(student_ids).any().to_numpy()
+    available_categories = tested_categories[year_groups['Student'].to_numpy()]
+
+    rankings = rank_question_types(data, 'Ranking Group', list(range(len(year_groups))), categories,
+                                   item_count_aggregate='sum', round_scores=False,
+                                   available_categories=available_categories)
+    ranking_groups = rankings.pop('Ranking Group').to_numpy(dtype=int)
+    rankings['Item Count'] = rankings['Item Count'].astype(int)
+    rankings['Test Year'] = year_groups['Test Year'].to_numpy()[ranking_groups]
+    rankings.index = year_groups['Student'].to_numpy()[ranking_groups]
+    for col in reversed(STUDENT_FILE_KEYS):
+        rankings.insert(0, col, students[col].to_numpy()[rankings.index])
+
+    return rankings, students
+
+
+# Create recommendations for teachers on which areas to focus on moving forward for every student in the district.
+# Each student's file in student_file_folder is copied unchanged as their "Scores" file, as the class path does, and
+# their top 3 areas per test year are ranked from BIG_DF in one pass and written by a pool of max_workers threads
+def create_district_student_recommendations(big_df, student_file_folder=None, max_workers=8):
+    start_time = time.perf_counter()
+    if student_file_folder is None:
+        student_file_folder = os.path.join(Path.cwd().parent, "Student Data Frames")
+    rankings, students = rank_student_question_types(big_df)
+    ranking_columns = ['Category', 'Average Score', 'Item Count', 'Ranking Value', 'Test Date Range', 'Test Year']
+
+    # Render all the rankings at once, then split the lines between the students
+    ranking_text = rankings[ranking_columns].to_csv(index=False, lineterminator='\n')
+    ranking_header, *ranking_lines = ranking_text.split('\n')[:-1]
+    ranking_ends = np.cumsum(np.bincount(rankings.index.to_numpy(), minlength=len(students)))
+
+    texts_by_path = {}
+    for student, (name, category, grade, max_test_group) in enumerate(students.itertuples(index=False)):
+        student_name = f"{name}".replace(' ', '_')
+        file_folder = os.path.join(Path.cwd().parent, "Processed Frames by Class", f"{grade}", f"{grade} {category}",
+                                   f"{student_name} {category}")
+        os.makedirs(file_folder, exist_ok=True)
+        file_stem = os.path.join(file_folder, f"{student_name} Grade {max_test_group} {category}")
+        shutil.copyfile(os.path.join(student_file_folder, f"{student_name}_{category}.csv"), f"{file_stem} Scores.csv")
+        start = ranking_ends[student - 1] if student else 0
+        texts_by_path[f"{file_stem} Recommendations.csv"] = '\n'.join(
+            [ranking_header] + ranking_lines[start:ranking_ends[student]]) + '\n'
+
+    written_paths, failed_paths = write_text_files(texts_by_path, max_workers)
+    print(f"Student recommendations saved: {len(written_paths)} written, {len(failed_paths)} failed in "
+          f"{time.perf_counter() - start_time:.2f} sec")
+    if failed_paths:
+        raise next(iter(failed_paths.values()))
+
+    return rankings
@@ -2,6 +2,67 @@ import pandas as pd
 import matplotlib.pyplot as plt
 from pathlib import Path
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from parsed_frame_functions import parse_score_file, read_parsed_frame, test_group_values
+
+
+# CHART RENDERING FUNCTIONS
+# Switch worker processes to the non-interactive Agg backend before any figures are drawn
+def use_agg_backend():
+    plt.switch_backend('Agg')
+
+
+# Run a single-file chart function, isolating any error to the file that raised it
+def render_chart_file(chart_function, file_path, output_directory):
+    try:
+        return chart_function(file_path, output_directory), None
+    except Exception as e:
+        return 0, f"{e}"
+
+
+# Render charts for every file, either one after another or spread across worker processes
+def render_charts(chart_function, file_paths, output_directory, parallel=False, max_workers=None):
+    start_time = time.perf_counter()
+    charts_saved = 0
+
+    if not parallel:
+        for file_path in file_paths:
+            charts_saved += chart_function(file_path, output_directory)
+    else:
+        failed_files = []
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=use_agg_backend) as executor:
+            futures = {executor.submit(render_chart_file, chart_function, file_path, output_directory): file_path
+                       for file_path in file_paths}
+            for future in as_completed(futures):
+                file_charts, error = future.result()
+                charts_saved += file_charts
+                if error:
+                    print(f"ERROR: Failed to create charts for {os.path.basename(futures[future])}: {error}")
+                    failed_files.append(futures[future])
+        if failed_files:
+            print(f"Charts failed for {len(failed_files)} of {len(file_paths)} files")
+
+    elapsed = time.perf_counter() - start_time
+    charts_per_second = charts_saved / elapsed if elapsed > 0 else 0.0
+    print(f"Saved {charts_saved} charts from {len(file_paths)} files in {elapsed:.1f} sec "
+          f"({charts_per_second:.1f} charts/sec)")
+
+    return charts_saved
+
+
+# PROGRESS SERIES FUNCTIONS
+# Build a test group's progress lines as one (test date x category) frame with a single grouped pass over its rows,
+# dates in order. Class charts use each category's mean score on each date; student charts (tested_only=True) use the
+# score from the row where the category was tested, leaving dates where it was not tested empty
+def progress_series(group_data, categories, tested_only=False):
+    categories = [category for category in categories if f"{category} Item Count" in group_data.columns]
+    scores = group_data[categories]
+    if tested_only:
+        tested = group_data[[f"{category} Item Count" for category in categories]].notna().to_numpy()
+        return scores.where(tested).groupby(group_data['Test Date']).first()
+
+    return scores.groupby(group_data['Test Date']).mean()
 
 
 # CLASS PLOT CREATION FUNCTIONS
@@ -12,32 +73,18 @@ def plot_progress_by_test_group_with_embedded_keys(data, categories, test_groups
     grade_levels = {str(i): f"Grade {i}" for i in range(1, 13)}  # Map numbers to grade levels
     grade_levels.update({'K': 'Kindergarten', 'former_student': 'Former Student'})  # Add additional grade levels
     colormap = plt.get_cmap('tab20')  # Explicitly fetch the tab20 colormap
+    charts_saved = 0
 
     for group in sorted(test_groups):
         print(f"Processing group: {group}")  # Debugging print
         group_data = data[data['Test Group'] == group]
-        group_test_dates = group_data['Test Date'].dropna().sort_values().unique()
-        group_test_dates_str = [pd.Timestamp(date).strftime('%m/%d/%Y') for date in group_test_dates]
-
-        group_categories = [category for category in categories if f"{category} Item Count" in group_data.columns]
-        group_progress_data = {category: [] for category in group_categories}
-
-        for category in group_categories:
-            item_count_col = f"{category} Item Count"
-            for date in group_test_dates:
-                relevant_rows = group_data[group_data['Test Date'] == date]
-                if not relevant_rows.empty:
-                    score = relevant_rows[category].mean()  # Calculate the mean score for the category
-                else:
-                    score = None
-                group_progress_data[category].append(score)
-
-        # Filter out dictionary items with all "None" in values
-        group_progress_data = {category: scores for category, scores in group_progress_data.items()
-                               if any(score is not None for score in scores)}
+
+        # Mean score of each category on each test date
+        group_progress_data = progress_series(group_data, categories)
+        group_test_dates_str = [pd.Timestamp(date).strftime('%m/%d/%Y') for date in group_progress_data.index]
 
         # Check if there is data to plot
-        if not group_progress_data:
+        if group_progress_data.empty:
             print(f"No valid data to plot for group: {group}")
             continue
 
@@ -58,7 +105,7 @@ def plot_progress_by_test_group_with_embedded_keys(data, categories, test_groups
         plt.ylabel('Average Score')
         plt.title(f"Class Progress in Each Category ({grade_levels.get(group, group)})")  # Use the group as fallback
 
-        if group_progress_data:
+        if not group_progress_data.empty:
             plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
 
         plt.grid(True)
@@ -72,6 +119,9 @@ def plot_progress_by_test_group_with_embedded_keys(data, categories, test_groups
         chart_path = os.path.join(chart_folder, f"class_progress_grade_{group}_{subject}.png")
         plt.savefig(chart_path)
         plt.close()
+        charts_saved += 1
+
+    return charts_saved
 
 
 # Function to process a single file
@@ -86,22 +136,16 @@ def process_file(input_file, output_folder):
     else:
         grade_level = None
 
-    data = pd.read_csv(input_file)
-
-    # Convert 'Test Date' to datetime for accurate range calculations
-    data['Test Date'] = pd.to_datetime(data['Test Date'], errors='coerce')
-
-    # Filter numeric columns only
-    numeric_data = data.select_dtypes(include='number')
-
-    # Extract all category names excluding 'Item Count' and 'Overall Score'
-    all_categories = [col for col in numeric_data.columns if 'Item Count' not in col and col != 'Overall Score']
+    # The file is parsed once ('Test Date' as datetimes, categories found) and shared with the recommendations
+    parsed = read_parsed_frame(input_file)
+    data = parsed['frame'].copy()
+    all_categories = parsed['categories']
 
     # Print unique values in the 'Test' column for debugging
     print("Unique values in 'Test' column:", data['Test'].unique())
 
     # Extract unique test groups based on the "Test" column, accounting for Kindergarten (K) and former_student
-    data['Test Group'] = data['Test'].str.extract(r'(\d+|k|former_student)', expand=False).replace('k', 'K')
+    data['Test Group'] = test_group_values(parsed, r'(\d+|k|former_student)').replace('k', 'K')
 
     # If grade_level is set to "former_student", override the Test Group
     if grade_level:
@@ -118,20 +162,19 @@ def process_file(input_file, output_folder):
     current_grade_level = data['Grade Level'].iloc[0]
 
     # Plot the progress data for each test group with embedded keys and differentiated symbols within each group
-    plot_progress_by_test_group_with_embedded_keys(data, all_categories, test_groups, output_folder, subject,
-                                                   current_grade_level)
+    return plot_progress_by_test_group_with_embedded_keys(data, all_categories, test_groups, output_folder, subject,
+                                                          current_grade_level)
 
 
 # Create charts for all class files in a directory
-def create_all_class_charts(input_directory):
+def create_all_class_charts(input_directory, parallel=False, max_workers=None):
     output_directory = os.path.join(Path.cwd().parent, "Processed Frames by Class")
     if not os.path.exists(output_directory):
         os.makedirs(output_directory)
 
-    for filename in os.listdir(input_directory):
-        if filename.endswith('.csv'):
-            file_path = os.path.join(input_directory, filename)
-            process_file(file_path, output_directory)
+    file_paths = [os.path.join(input_directory, filename) for filename in os.listdir(input_directory)
+                  if filename.endswith('.csv')]
+    render_charts(process_file, file_paths, output_directory, parallel, max_workers)
 
     return output_directory
 
@@ -144,29 +187,15 @@ def plot_student_progress_by_grade_level_with_embedded_keys(data, categories, te
     grade_levels = {str(i): f"Grade {i}" for i in range(1, 13)}  # Map numbers to grade levels
     grade_levels.update({'K': 'Kindergarten'})  # Add Kindergarten
     colormap = plt.get_cmap('tab20')  # Explicitly fetch the tab20 colormap
+    charts_saved = 0
 
     for group in sorted(test_groups):
         print(f"Processing group: {group}")  # Debugging print
         group_data = data[data['Test Group'] == group]
-        group_test_dates = group_data['Test Date'].dropna().sort_values().unique()
-        group_test_dates_str = [pd.Timestamp(date).strftime('%m/%d/%Y') for date in group_test_dates]
-
-        group_categories = [category for category in categories if f"{category} Item Count" in group_data.columns]
-        group_progress_data = {category: [] for category in group_categories}
-
-        for category in group_categories:
-            item_count_col = f"{category} Item Count"
-            for date in group_test_dates:
-                relevant_row = group_data[(group_data['Test Date'] == date) & (group_data[item_count_col].notnull())]
-                if not relevant_row.empty:
-                    score = relevant_row[category].values[0]
-                else:
-                    score = None
-                group_progress_data[category].append(score)
-
-        # Filter out dictionary items with all "None" in values
-        group_progress_data = {category: scores for category, scores in group_progress_data.items()
-                               if any(score is not None for score in scores)}
+
+        # The student's score in each category on each test date, leaving out categories they were never tested on
+        group_progress_data = progress_series(group_data, categories, tested_only=True).dropna(axis=1, how='all')
+        group_test_dates_str = [pd.Timestamp(date).strftime('%m/%d/%Y') for date in group_progress_data.index]
 
         plt.figure(figsize=(14, 8))
         used_colors = set()  # Reset used colors for each group
@@ -198,6 +227,9 @@ def plot_student_progress_by_grade_level_with_embedded_keys(data, categories, te
                                   f"{grade_levels.get(group, group).replace(' ', '_').lower()}_{subject}_progress.png")
         plt.savefig(chart_path)
         plt.close()
+        charts_saved += 1
+
+    return charts_saved
 
 
 # Extract student name from filename
@@ -214,22 +246,16 @@ def process_student_file(input_file, output_folder):
     filename = os.path.basename(input_file)
     print(f"PROCESSING FILE {filename}")  # debug print statement
     student_name, subject = extract_student_name_and_subject(filename)
-    data = pd.read_csv(input_file)
-
-    # Convert 'Test Date' to datetime for accurate range calculations
-    data['Test Date'] = pd.to_datetime(data['Test Date'], errors='coerce')
-
-    # Filter numeric columns only
-    numeric_data = data.select_dtypes(include='number')
-
-    # Extract all category names excluding 'Item Count' and 'Overall Score'
-    all_categories = [col for col in numeric_data.columns if 'Item Count' not in col and col != 'Overall Score']
+    # Student files are read by no other stage, so they are parsed without going through the shared cache
+    parsed = parse_score_file(input_file)
+    data = parsed['frame']
+    all_categories = parsed['categories']
 
     # Print unique values in the 'Test' column for debugging
     print("Unique values in 'Test' column:", data['Test'].unique())
 
     # Extract unique test groups based on the "Test" column, accounting for Kindergarten (K)
-    data['Test Group'] = data['Test'].str.extract(r'(\d+|[kK])', expand=False).replace(['k', 'K'], 'K')
+    data['Test Group'] = test_group_values(parsed, r'(\d+|[kK])').replace(['k', 'K'], 'K')
 
     # Debugging print to check extracted groups
     print("Extracted Test Groups:", data['Test Group'].unique())
@@ -240,15 +266,14 @@ def process_student_file(input_file, output_folder):
     current_grade_level = data['Grade Level'].iloc[0]
 
     # Plot the progress data for each test group with embedded keys and differentiated symbols within each group
-    plot_student_progress_by_grade_level_with_embedded_keys(data, all_categories, test_groups, output_folder,
-                                                            student_name, subject, current_grade_level)
+    return plot_student_progress_by_grade_level_with_embedded_keys(data, all_categories, test_groups, output_folder,
+                                                                   student_name, subject, current_grade_level)
 
 
 # Create charts for all student files in a directory
-def create_all_student_charts(input_directory, output_directory):
-    for filename in os.listdir(input_directory):
-        if filename.endswith('.csv'):
-            file_path = os.path.join(input_directory, filename)
-            process_student_file(file_path, output_directory)
+def create_all_student_charts(input_directory, output_directory, parallel=False, max_workers=None):
+    file_paths = [os.path.join(input_directory, filename) for filename in os.listdir(input_directory)
+                  if filename.endswith('.csv')]
+    render_charts(process_student_file, file_paths, output_directory, parallel, max_workers)
 
     return output_directory
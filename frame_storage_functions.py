@@ -0,0 +1,83 @@
+import os
+import pandas as pd
+
+
+# File extension used for each supported intermediate frame format
+FRAME_FORMATS = {'csv': '.csv', 'parquet': '.parquet'}
+
+# Parsed test dates are written to csv files in the MM/DD/YYYY form the CBM site downloads them in
+CSV_DATE_FORMAT = '%m/%d/%Y'
+
+
+# Current intermediate frame format; kept in the environment so worker processes write the same format
+def get_frame_format():
+    return os.environ.get('CBM_FRAME_FORMAT', 'csv')
+
+
+# Choose the format for the intermediate frames ('csv' or 'parquet')
+def set_frame_format(frame_format):
+    if frame_format not in FRAME_FORMATS:
+        raise ValueError(f"Unsupported frame format '{frame_format}'. Choose one of: {list(FRAME_FORMATS)}")
+    os.environ['CBM_FRAME_FORMAT'] = frame_format
+
+
+# Check whether a file is an intermediate frame in the current format (or frame_format). Frames left behind in another
+# format by an earlier run are not picked up, so a folder is never read twice over
+def is_frame_file(filename, frame_format=None):
+    return filename.endswith(FRAME_FORMATS[frame_format or get_frame_format()])
+
+
+# Build the path of a frame from its folder and file name without extension
+def frame_path(folder, stem, frame_format=None):
+    return os.path.join(folder, f"{stem}{FRAME_FORMATS[frame_format or get_frame_format()]}")
+
+
+# Locate an existing frame regardless of the format it was written in, preferring the current format
+def find_frame(folder, stem):
+    preferred_path = frame_path(folder, stem)
+    if os.path.exists(preferred_path):
+        return preferred_path
+    for frame_format in FRAME_FORMATS:
+        path = frame_path(folder, stem, frame_format)
+        if os.path.exists(path):
+            return path
+
+    return preferred_path
+
+
+# Save a frame to a path, choosing the writer from the path's extension
+def save_frame(df, path):
+    if path.endswith(FRAME_FORMATS['parquet']):
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False, date_format=CSV_DATE_FORMAT)
+
+    return path
+
+
+# Write a frame in the current format and return the path written
+def write_frame(df, folder, stem, frame_format=None):
+    return save_frame(df, frame_path(folder, stem, frame_format))
+
+
+# Read a frame, loading only the requested columns; columns may be a list or a callable filter on column names
+def read_frame(path, columns=None):
+    if not path.endswith(FRAME_FORMATS['parquet']):
+        return pd.read_csv(path, usecols=columns)
+
+    if callable(columns):
+        import pyarrow.parquet as pq
+        columns = [col for col in pq.read_schema(path).names if columns(col)]
+
+    return pd.read_parquet(path, columns=columns)
+
+
+# Export every Parquet frame in a folder to a CSV file alongside it
+def export_frames_to_csv(folder):
+    exported_paths = []
+    for filename in sorted(os.listdir(folder)):
+        if filename.endswith(FRAME_FORMATS['parquet']):
+            stem = filename[:-len(FRAME_FORMATS['parquet'])]
+            exported_paths.append(write_frame(read_frame(os.path.join(folder, filename)), folder, stem, 'csv'))
+
+    return exported_paths
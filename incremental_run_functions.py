@@ -0,0 +1,113 @@
+import os
+import json
+import hashlib
+import pandas as pd
+from pathlib import Path
+
+
+# Version of each cleaning stage's logic, recorded with every stage it runs. Bump a stage's version whenever it starts
+# producing different outputs from the same inputs, so records written by the older code are no longer trusted
+STAGE_VERSIONS = {
+    'get_category_scores': 2,
+    'combine_csv_files': 1,
+    'add_date_data': 2,
+    'combine_big_frames': 2,
+    'save_files_by_student': 2,
+    'save_files_by_class': 2,
+}
+
+
+# Version of the stage a stage key (e.g. 'get_category_scores/admin/test') belongs to
+def stage_version(stage_key):
+    return STAGE_VERSIONS.get(stage_key.split('/')[0], 1)
+
+
+# Default location of the manifest that records what each cleaning stage consumed and produced
+def manifest_file_path():
+    return os.path.join(Path.cwd().parent, "pipeline_manifest.json")
+
+
+# Load the manifest from a previous run, starting an empty one if none exists or it cannot be read
+def load_manifest(manifest_path=None):
+    manifest_path = manifest_path or manifest_file_path()
+    try:
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        manifest = {}
+    manifest.setdefault("stages", {})
+
+    return manifest
+
+
+# Save the manifest so the next run can skip stages whose inputs are unchanged
+def save_manifest(manifest, manifest_path=None):
+    manifest_path = manifest_path or manifest_file_path()
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=4)
+
+
+# Hash a file's contents in chunks so large frames never have to be loaded into memory
+def hash_file(file_path):
+    file_hash = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            file_hash.update(chunk)
+
+    return file_hash.hexdigest()
+
+
+# Hash every file in a list, keyed by path
+def hash_files(file_paths):
+    return {f"{file_path}": hash_file(file_path) for file_path in file_paths}
+
+
+# Hash an in-memory data frame, including its column names, for stages that take frames rather than files
+def hash_frame(df):
+    frame_hash = hashlib.sha256()
+    frame_hash.update(json.dumps([f"{col}" for col in df.columns]).encode("utf-8"))
+    frame_hash.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+
+    return frame_hash.hexdigest()
+
+
+# Hash a group of rows split from a larger frame from its columns and its rows' precomputed hashes
+def hash_frame_rows(columns, row_hashes):
+    frame_hash = hashlib.sha256()
+    frame_hash.update(json.dumps([f"{col}" for col in columns]).encode("utf-8"))
+    frame_hash.update(row_hashes.tobytes())
+
+    return frame_hash.hexdigest()
+
+
+# Hash a JSON-serializable object such as the grade levels dictionary
+def hash_object(obj):
+    return hashlib.sha256(json.dumps(obj, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+# Check whether a stage (or partition of a stage) already ran on these exact inputs and its outputs are intact
+def stage_is_current(manifest, stage_key, input_hashes, output_paths):
+    if manifest is None:
+        return False
+
+    record = manifest["stages"].get(stage_key)
+    if record is None or record.get("version") != stage_version(stage_key) or record["inputs"] != input_hashes:
+        return False
+
+    # Outputs must still exist and be unmodified since they were written
+    if sorted(record["outputs"]) != sorted(f"{path}" for path in output_paths):
+        return False
+    for output_path, output_hash in record["outputs"].items():
+        if not os.path.exists(output_path) or hash_file(output_path) != output_hash:
+            return False
+
+    return True
+
+
+# Record the inputs and outputs of a stage that just ran
+def record_stage(manifest, stage_key, input_hashes, output_paths):
+    if manifest is None:
+        return
+
+    manifest["stages"][stage_key] = {"version": stage_version(stage_key), "inputs": input_hashes,
+                                     "outputs": hash_files(output_paths)}
@@ -0,0 +1,69 @@
+import os
+from collections import OrderedDict
+import pandas as pd
+from frame_storage_functions import read_frame
+
+
+# Columns of the class and student files that are never ranked or charted and so are not loaded
+UNSCORED_COLUMNS = ('Student Name', 'Administrator', 'Overall Score')
+
+# Default memory bound of the parsed-frame cache; least recently used files are dropped past it
+PARSED_FRAME_CACHE_BYTES = 256 * 1024 ** 2
+
+# Parsed class files shared by the chart and recommendation stages, keyed by path and checked against the file's
+# modification time and size so a rewritten file is parsed again
+parsed_frame_cache = {'frames': OrderedDict(), 'bytes': 0, 'hits': 0, 'misses': 0}
+
+
+# Parse a class or student file: the frame without the unscored columns and with 'Test Date' as datetimes, and its
+# categories (numeric columns other than item counts). Test groups are extracted on request by test_group_values
+def parse_score_file(file_path):
+    data = read_frame(file_path, columns=lambda col: col not in UNSCORED_COLUMNS)
+    data['Test Date'] = pd.to_datetime(data['Test Date'], errors='coerce')
+    categories = [col for col in data.select_dtypes(include='number').columns
+                  if 'Item Count' not in col and col != 'Overall Score']
+
+    return {'frame': data, 'categories': categories, 'test_groups': {},
+            'bytes': int(data.memory_usage(deep=True).sum())}
+
+
+# Return a file's parsed frame from the cache, parsing it if it is new or has changed since it was cached. The
+# parsed frame is shared, so callers copy it before changing it
+def read_parsed_frame(file_path, max_bytes=PARSED_FRAME_CACHE_BYTES):
+    frames = parsed_frame_cache['frames']
+    key = os.path.abspath(file_path)
+    file_stat = os.stat(file_path)
+    stamp = (file_stat.st_mtime_ns, file_stat.st_size)
+
+    parsed = frames.get(key)
+    if parsed is not None and parsed['stamp'] == stamp:
+        frames.move_to_end(key)
+        parsed_frame_cache['hits'] += 1
+        return parsed
+
+    if parsed is not None:
+        parsed_frame_cache['bytes'] -= frames.pop(key)['bytes']
+    parsed = parse_score_file(file_path)
+    parsed['stamp'] = stamp
+    parsed_frame_cache['misses'] += 1
+
+    frames[key] = parsed
+    parsed_frame_cache['bytes'] += parsed['bytes']
+    while parsed_frame_cache['bytes'] > max_bytes and len(frames) > 1:
+        parsed_frame_cache['bytes'] -= frames.popitem(last=False)[1]['bytes']
+
+    return parsed
+
+
+# Extract each row's test group (or test year) from the 'Test' column with the given pattern, once per parsed file
+def test_group_values(parsed, pattern):
+    if pattern not in parsed['test_groups']:
+        parsed['test_groups'][pattern] = parsed['frame']['Test'].str.extract(pattern, expand=False)
+
+    return parsed['test_groups'][pattern]
+
+
+# Drop every cached frame and reset the hit counts
+def clear_parsed_frame_cache():
+    parsed_frame_cache['frames'].clear()
+    parsed_frame_cache.update({'bytes': 0, 'hits': 0, 'misses': 0})
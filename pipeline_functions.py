@@ -0,0 +1,73 @@
+import os
+import pandas as pd
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from frame_storage_functions import frame_path, write_frame
+from test_date_file_functions import newest_test_date_file
+from data_cleaning_functions import build_category_frame
+from data_cleaning_functions import read_test_date_file
+from data_cleaning_functions import attach_test_dates
+from data_cleaning_functions import assign_grade_levels
+from data_cleaning_functions import apply_big_frame_schema
+
+
+# Create the state handed between in-memory pipeline stages; checkpoint also writes each stage's frames to disk
+def create_pipeline(checkpoint=False, parallel=False, max_workers=None):
+    return {
+        'checkpoint': checkpoint,
+        'parallel': parallel,
+        'max_workers': max_workers,
+        'dated_frames': {},
+    }
+
+
+# Write a checkpoint frame into its usual folder, creating the folder if needed
+def write_checkpoint(df, folder, stem):
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    path = write_frame(df, folder, stem)
+    print(f"Checkpoint saved: {path}")
+
+    return path
+
+
+# Score, combine, and date one account's tests in memory, holding the dated frame for build_big_frame
+def clean_account_frames(pipeline, username, test_list, combined_frames_folder):
+    # Combine tests in the same order combine_csv_files reads their files
+    tests = sorted(test_list, key=lambda test: os.path.basename(frame_path('', f'{username}_{test}')))
+
+    if pipeline['parallel']:
+        with ProcessPoolExecutor(max_workers=pipeline['max_workers']) as executor:
+            category_frames = list(executor.map(build_category_frame, [username] * len(tests), tests))
+    else:
+        category_frames = [build_category_frame(username, test) for test in tests]
+
+    combined_df = pd.concat(category_frames, ignore_index=True)
+
+    date_file_path = newest_test_date_file(combined_frames_folder)
+    dated_df = attach_test_dates(combined_df.copy(), read_test_date_file(date_file_path))
+    pipeline['dated_frames'][username] = dated_df
+
+    if pipeline['checkpoint']:
+        test_frame_folder = os.path.join(Path.cwd().parent, "Single Test Data Frames", f"{username}")
+        for test, category_frame in zip(tests, category_frames):
+            write_checkpoint(category_frame, test_frame_folder, f'{username}_{test}')
+        write_checkpoint(combined_df, combined_frames_folder, f"{username}_combined_df")
+        write_checkpoint(dated_df, os.path.join(os.path.dirname(combined_frames_folder),
+                                                "Combined Data Frames With Dates"), f"{username}_with_dates")
+
+    return dated_df
+
+
+# Combine every account's dated frame held in memory into BIG_DF and add grade levels
+def build_big_frame(pipeline, grade_levels):
+    dated_frames = [pipeline['dated_frames'][username] for username in sorted(pipeline['dated_frames'])]
+    big_df = apply_big_frame_schema(assign_grade_levels(pd.concat(dated_frames, ignore_index=True), grade_levels))
+
+    if pipeline['checkpoint']:
+        write_checkpoint(big_df, str(Path.cwd().parent), "BIG_DF")
+
+    # Debug: print sample of big_df to verify
+    print(big_df.head())
+
+    return big_df
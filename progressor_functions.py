@@ -2,6 +2,7 @@ import pandas as pd
 import os
 from pathlib import Path
 from selenium.webdriver.common.by import By
+from cbm_login_functions import site_url
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as ec
 from selenium.common.exceptions import WebDriverException, NoSuchElementException
@@ -13,9 +14,8 @@ def nav_to_tables(driver):
     print("Navigating to testing information page...")
     # Navigate to page
     try:
-        page = f"https://app.easycbm.com/teachers/auth/reporting.php"
+        page = site_url("/teachers/auth/reporting.php")
         # create page driver
-        driver.maximize_window()
         driver.get(page)
     except WebDriverException:
         print(f"Error: Failed to load stats from item analysis table")
@@ -90,32 +90,62 @@ def combine_csv_files(input_folder_path, grade_levels):
     combined_df.to_csv(os.path.join(Path.cwd().parent, "BIG_DF.csv"), index=False)
 
 
+# Read only the item and question type columns of a file and find the rows missing a question type
+def missing_type_rows(file_path):
+    df = pd.read_csv(file_path, usecols=lambda col: col in ('Item', 'Type'))
+    if 'Type' not in df.columns:
+        return None
+    missing = df['Type'].isnull() | (df['Type'] == '')
+    return {
+        'rows': df.index[missing].tolist(),
+        'items': df.loc[missing, 'Item'].tolist() if 'Item' in df.columns else [],
+    }
+
+
+# Check every file in the folder for missing question types, reusing earlier results for files whose modification
+# time and size have not changed. Returns a report of the missing rows per test
+def validate_type_data(input_folder_path, validation_cache):
+    report = {'incomplete_tests': {}, 'missing_type_column': [], 'unreadable': {}, 'checked': 0, 'reused': 0}
+
+    for filename in sorted(os.listdir(input_folder_path)):
+        file_path = os.path.join(input_folder_path, filename)
+        try:
+            file_stat = os.stat(file_path)
+            file_key = (file_stat.st_mtime_ns, file_stat.st_size)
+            if validation_cache.get(file_path, (None,))[0] == file_key:
+                result = validation_cache[file_path][1]
+                report['reused'] += 1
+            else:
+                result = missing_type_rows(file_path)
+                validation_cache[file_path] = (file_key, result)
+                report['checked'] += 1
+        except Exception as e:
+            report['unreadable'][filename] = str(e)
+            continue
+
+        if result is None:
+            report['missing_type_column'].append(filename)
+        elif result['rows']:
+            report['incomplete_tests'][filename] = result
+
+    return report
+
+
 # Check for missing question category values and give the user options on how to account for the missing data
 def check_and_fill_data(input_folder_path):
+    validation_cache = {}
     # Continue prompting the user to address missing data until it is resolved
     while True:
-        incomplete_tests = []
-
-        # Loop through all the files in the folder
-        for filename in os.listdir(input_folder_path):
-            file_path = os.path.join(input_folder_path, filename)
-            print(f"Checking file: {file_path}")
-
-            try:
-                df = pd.read_csv(file_path)
-                # Check if 'Type' column exists and if it has missing data
-                if 'Type' in df.columns and ((df['Type'].isnull() | (df['Type'] == '')).any()):
-                    print(f"Missing data found in {filename}")
-                    # If data is missing, add the file name to the incomplete tests list
-                    incomplete_tests.append(filename)
-                elif 'Type' not in df.columns:
-                    print(f"'Type' column missing in {filename}")
-                else:
-                    print(f"No missing 'Type' data in {filename}")
-            except Exception as e:
-                print(f"Error reading {filename}: {e}")
+        report = validate_type_data(input_folder_path, validation_cache)
+        print(f"Checked {report['checked']} files for missing 'Type' data ({report['reused']} unchanged files "
+              f"skipped)")
+        for filename, error in report['unreadable'].items():
+            print(f"Error reading {filename}: {error}")
+        incomplete_tests = list(report['incomplete_tests'])
 
         if incomplete_tests:
+            for filename, missing in report['incomplete_tests'].items():
+                print(f"Missing data found in {filename}: {len(missing['rows'])} rows, items {missing['items']}")
             print(f"\nERROR: The following files are missing QUESTION TYPE data: {incomplete_tests}")
             response = input("To fill in missing data, cross-reference the test data on the EasyCBM website \n"
                              "with the listed files, located in the 'Extracted Data Frames' folder, and manually \n"
@@ -136,4 +166,4 @@ def check_and_fill_data(input_folder_path):
                 continue  # Recheck to confirm the removals before proceeding
         else:
             print("All test files updated.")
-            break  # Exit the loop if all files are complete
+            return report  # Exit the loop if all files are complete
@@ -0,0 +1,164 @@
+import os
+import json
+import time
+import tracemalloc
+import pandas as pd
+from pathlib import Path
+
+
+# Pipeline output folders under the output root. Files written by a stage are counted in these folders and directly
+# in the output root (BIG_DF, grade levels, manifest) only, so the rest of the parent folder is never walked
+OUTPUT_FOLDERS = ('Extracted Data Frames', 'Combined Frames by User', 'Single Test Data Frames', 'Class Data Frames',
+                  'Student Data Frames', 'Processed Frames by Class', 'Student Dataset')
+
+
+# Create a trace recording wall time, CPU time, rows, and files written for each stage of a run. Peak memory comes
+# from tracemalloc, which slows pandas-heavy stages considerably, so it is only recorded with trace_memory=True
+def create_run_trace(trace_memory=False):
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+    return {
+        'started': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'output_root': str(Path.cwd().parent),
+        'trace_memory': trace_memory,
+        'stages': [],
+        'open_stages': [],
+    }
+
+
+# Count files under root_folder modified since the given time
+def count_files_written(root_folder, since):
+    files_written = 0
+    for folder, _, filenames in os.walk(root_folder):
+        for filename in filenames:
+            try:
+                if os.path.getmtime(os.path.join(folder, filename)) >= since:
+                    files_written += 1
+            except OSError:
+                continue
+
+    return files_written
+
+
+# Count files modified since the given time directly in output_root and under its pipeline output folders
+def count_output_files_written(output_root, since):
+    files_written = 0
+    with os.scandir(output_root) as entries:
+        for entry in entries:
+            try:
+                if entry.is_file() and entry.stat().st_mtime >= since:
+                    files_written += 1
+            except OSError:
+                continue
+
+    for folder in OUTPUT_FOLDERS:
+        files_written += count_files_written(os.path.join(output_root, folder), since)
+
+    return files_written
+
+
+# Start timing a stage; stages may be nested, e.g. each scraped test inside write_test_tables
+def start_trace_stage(trace, stage_name):
+    if trace is None:
+        return
+    if trace['trace_memory']:
+        # Carry the enclosing stage's peak so far past the reset below
+        if trace['open_stages']:
+            parent = trace['open_stages'][-1]
+            parent['peak_memory'] = max(parent['peak_memory'], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+
+    trace['open_stages'].append({
+        'stage': stage_name,
+        'start_time': time.time(),
+        'wall_start': time.perf_counter(),
+        'cpu_start': time.process_time(),
+        'peak_memory': 0,
+    })
+
+
+# Finish the innermost open stage. Files written are counted in the output folders unless files_written is given
+def end_trace_stage(trace, rows=None, files_written=None, error=None):
+    if trace is None:
+        return
+    wall_seconds = time.perf_counter() - trace['open_stages'][-1]['wall_start']
+    cpu_seconds = time.process_time() - trace['open_stages'][-1]['cpu_start']
+    stage = trace['open_stages'].pop()
+
+    peak_memory = None
+    if trace['trace_memory']:
+        peak_memory = max(stage['peak_memory'], tracemalloc.get_traced_memory()[1])
+        if trace['open_stages']:
+            parent = trace['open_stages'][-1]
+            parent['peak_memory'] = max(parent['peak_memory'], peak_memory)
+
+    if files_written is None:
+        files_written = count_output_files_written(trace['output_root'], stage['start_time'])
+
+    trace['stages'].append({
+        'stage': stage['stage'],
+        'wall_seconds': round(wall_seconds, 4),
+        'cpu_seconds': round(cpu_seconds, 4),
+        'peak_memory_mb': round(peak_memory / 1024 ** 2, 2) if peak_memory is not None else None,
+        'rows': rows,
+        'files_written': files_written,
+        'error': error,
+    })
+
+
+# Run one stage under the trace and return its result; rows defaults to the length of a returned frame
+def traced_step(trace, stage_name, step, *args, rows=None, **kwargs):
+    if trace is None:
+        return step(*args, **kwargs)
+
+    depth = len(trace['open_stages'])
+    start_trace_stage(trace, stage_name)
+    try:
+        result = step(*args, **kwargs)
+    except Exception as e:
+        # Close any nested stages the failure left open before closing this one
+        while len(trace['open_stages']) > depth:
+            end_trace_stage(trace, rows, error=f"{type(e).__name__}: {e}")
+        raise
+    if rows is None and isinstance(result, pd.DataFrame):
+        rows = len(result)
+    end_trace_stage(trace, rows)
+
+    return result
+
+
+# Save the trace as json next to the pipeline's output folders
+def save_run_trace(trace, trace_path=None):
+    if trace_path is None:
+        trace_path = os.path.join(trace['output_root'], f"run_trace_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    run_trace = {key: value for key, value in trace.items() if key != 'open_stages'}
+    with open(trace_path, 'w') as f:
+        json.dump(run_trace, f, indent=4)
+    print(f"Run trace saved: {trace_path}")
+
+    return trace_path
+
+
+# Print each stage's totals, combining repeated stages such as per-account scoring and per-test scraping
+def print_run_trace_summary(trace):
+    summary = {}
+    for stage in trace['stages']:
+        stage_name = stage['stage'].split('/')[0]
+        totals = summary.setdefault(stage_name, {'count': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0,
+                                                 'peak_memory_mb': None, 'rows': 0, 'files_written': 0})
+        totals['count'] += 1
+        totals['wall_seconds'] += stage['wall_seconds']
+        totals['cpu_seconds'] += stage['cpu_seconds']
+        if stage['peak_memory_mb'] is not None:
+            totals['peak_memory_mb'] = max(totals['peak_memory_mb'] or 0, stage['peak_memory_mb'])
+        totals['rows'] += stage['rows'] or 0
+        totals['files_written'] += stage['files_written'] or 0
+
+    print(f"\n{'Stage':<46}{'Runs':>6}{'Wall sec':>10}{'CPU sec':>10}{'Peak MB':>10}{'Rows':>10}{'Files':>8}")
+    for stage_name, totals in sorted(summary.items(), key=lambda item: item[1]['wall_seconds'], reverse=True):
+        peak_memory = f"{totals['peak_memory_mb']:.2f}" if totals['peak_memory_mb'] is not None else '-'
+        print(f"{stage_name:<46}{totals['count']:>6}{totals['wall_seconds']:>10.2f}{totals['cpu_seconds']:>10.2f}"
+              f"{peak_memory:>10}{totals['rows']:>10}{totals['files_written']:>8}")
+
+    return summary
@@ -0,0 +1,224 @@
+import os
+import json
+import time
+import html
+import shutil
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from cbm_login_functions import create_destination_folder
+from cbm_login_functions import login_account
+from progressor_functions import nav_to_tables
+from cbm_site_data_collection_functions import save_test_date_data
+from cbm_site_data_collection_functions import write_test_tables
+from cbm_site_data_collection_functions import write_student_tables
+from cbm_site_data_collection_functions import get_grade_levels
+from scrape_recording_functions import create_recording
+from scrape_recording_functions import save_recording
+from scrape_recording_functions import load_recording
+
+
+LOGIN_PAGE = """<html><body>
+<form action="/login" method="post">
+<input id="username" name="username"><input id="password" name="password" type="password">
+<button type="submit">Sign In</button>
+</form>
+</body></html>"""
+
+REPORTING_PAGE = """<html><body>
+<a href="/teachers/logout.php">Log Out</a>
+<button id="reportsSubTab_GroupingsButton">Groupings</button>
+<table><tr><td class="reportingGroupingNameCol">All Students</td></tr></table>
+<a id="gid_link_1" href="/download/{download_file}">Download test dates</a>
+<div>{test_buttons}</div>
+<div id="reportTables"></div>
+<script>
+const tests = {tests_json};
+function showTest(name) {{
+    setTimeout(() => {{
+        const tables = tests[name] || {{}};
+        document.getElementById('reportTables').innerHTML =
+            (tables.reportItemAnalysisTable || '') + (tables.studentReportingTable || '');
+    }}, {latency_ms});
+}}
+</script>
+</body></html>"""
+
+STUDENTS_PAGE = """<html><body>
+<a href="/teachers/logout.php">Log Out</a>
+<div><label><input type="radio" name="active-group">All Students</label>{group_inputs}</div>
+<div id="studentList"></div>
+<script>
+const groups = {groups_json};
+function showGroup(label) {{
+    setTimeout(() => {{
+        const studentList = document.getElementById('studentList');
+        studentList.innerHTML = '';
+        for (const name of groups[label] || []) {{
+            const entry = document.createElement('div');
+            entry.className = 'checked';
+            entry.textContent = name;
+            studentList.appendChild(entry);
+        }}
+    }}, {latency_ms});
+}}
+</script>
+</body></html>"""
+
+
+# Embed recorded data in a page script without letting recorded html close the script tag
+def script_json(data):
+    return json.dumps(data).replace("</", "<\\/")
+
+
+# Build the request handler that replays a recording, adding latency seconds to every response and table render
+def fixture_request_handler(recording_dir, recording, latency):
+    latency_ms = int(latency * 1000)
+
+    reporting_page = REPORTING_PAGE.format(
+        download_file=html.escape(recording['download_file'] or ''),
+        test_buttons=''.join(f'<div class="fleft" data-test="{html.escape(label)}" '
+                             f'onclick="showTest(this.dataset.test)">{html.escape(label)}</div>'
+                             for label in recording['test_buttons']),
+        tests_json=script_json(recording['tests']),
+        latency_ms=latency_ms)
+    students_page = STUDENTS_PAGE.format(
+        group_inputs=''.join(f'<label><input type="radio" name="active-group" '
+                             f'onclick="showGroup(this.nextSibling.textContent.trim())">{html.escape(label)}</label>'
+                             for label in recording['grade_levels']),
+        groups_json=script_json(recording['grade_levels']),
+        latency_ms=latency_ms)
+    pages = {
+        '/': LOGIN_PAGE,
+        '/teachers/logout.php': LOGIN_PAGE,
+        '/teachers/auth/reporting.php': reporting_page,
+        '/teachers/auth/students.php': students_page,
+    }
+
+    class FixtureRequestHandler(BaseHTTPRequestHandler):
+        def send_body(self, body, content_type, extra_headers=None):
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            for header, value in (extra_headers or {}).items():
+                self.send_header(header, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            path = self.path.split('?')[0]
+            if path in pages:
+                self.send_body(pages[path].encode('utf-8'), 'text/html; charset=utf-8')
+            elif path.startswith('/download/') and recording['download_file'] == os.path.basename(path):
+                with open(os.path.join(recording_dir, recording['download_file']), 'rb') as f:
+                    self.send_body(f.read(), 'text/csv', {
+                        'Content-Disposition': f'attachment; filename="{recording["download_file"]}"'})
+            else:
+                self.send_error(404)
+
+        def do_POST(self):
+            # Any credentials log in to the fixture site
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            time.sleep(latency)
+            self.send_response(303)
+            self.send_header('Location', '/teachers/auth/reporting.php')
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    return FixtureRequestHandler
+
+
+# Serve a recording from a local stand-in for the EasyCBM site and point the scrapers at it
+def start_fixture_server(recording_dir, latency=0.0, port=0):
+    recording = load_recording(recording_dir)
+    server = ThreadingHTTPServer(('127.0.0.1', port), fixture_request_handler(recording_dir, recording, latency))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    os.environ['CBM_BASE_URL'] = f"http://127.0.0.1:{server.server_port}"
+    print(f"Fixture server replaying {recording_dir} at {os.environ['CBM_BASE_URL']} ({latency} sec latency)")
+
+    return server
+
+
+# Stop the fixture server and point the scrapers back at the live site
+def stop_fixture_server(server):
+    server.shutdown()
+    server.server_close()
+    os.environ.pop('CBM_BASE_URL', None)
+
+
+# Scrape one live account while recording the reporting tables, student lists, and test date download
+def record_account(cbm_username, cbm_password, recording_dir, timer=1, headless=False):
+    recorder = create_recording(recording_dir)
+    combined_frames_folder = create_destination_folder(cbm_username)
+    driver = login_account(cbm_username, cbm_password, combined_frames_folder, headless)
+    if driver is None:
+        raise RuntimeError(f"invalid login for {cbm_username}")
+
+    try:
+        nav_to_tables(driver)
+        save_test_date_data(driver, combined_frames_folder, timer, recorder=recorder)
+        test_file_names, extracted_data_frames_folder = write_test_tables(driver, cbm_username, timer,
+                                                                          recorder=recorder)
+        nav_to_tables(driver)
+        write_student_tables(driver, test_file_names, cbm_username, extracted_data_frames_folder, timer,
+                             recorder=recorder)
+        get_grade_levels(driver, recorder=recorder)
+    finally:
+        driver.quit()
+
+    return save_recording(recorder)
+
+
+# Run one scraping step, recording how long it took
+def timed_step(step_times, step_name, step, *args):
+    start_time = time.perf_counter()
+    result = step(*args)
+    step_times[step_name] = step_times.get(step_name, 0.0) + time.perf_counter() - start_time
+
+    return result
+
+
+# Replay a recording through the scrapers offline, timing each scraping step. The scrapers write relative to the
+# working directory's parent, so the replay runs from a scratch folder and never touches the real output folders or
+# grade_levels_dict.json; keep_output leaves the scratch folder in place for inspection
+def replay_account(recording_dir, latency=0.0, timer=1, headless=True, username='fixture_replay', keep_output=False):
+    recording_dir = os.path.abspath(recording_dir)
+    scratch_folder = tempfile.mkdtemp(prefix='cbm_replay_')
+    working_folder = os.path.join(scratch_folder, 'run')
+    os.makedirs(working_folder)
+    previous_folder = os.getcwd()
+    os.chdir(working_folder)
+
+    server = start_fixture_server(recording_dir, latency)
+    step_times = {}
+    try:
+        combined_frames_folder = create_destination_folder(username)
+        driver = timed_step(step_times, 'login', login_account, username, 'fixture', combined_frames_folder,
+                            headless)
+        try:
+            timed_step(step_times, 'nav_to_tables', nav_to_tables, driver)
+            timed_step(step_times, 'save_test_date_data', save_test_date_data, driver, combined_frames_folder, timer)
+            test_file_names, extracted_data_frames_folder = timed_step(step_times, 'write_test_tables',
+                                                                       write_test_tables, driver, username, timer)
+            timed_step(step_times, 'nav_to_tables', nav_to_tables, driver)
+            timed_step(step_times, 'write_student_tables', write_student_tables, driver, test_file_names, username,
+                       extracted_data_frames_folder, timer)
+            timed_step(step_times, 'get_grade_levels', get_grade_levels, driver)
+        finally:
+            driver.quit()
+    finally:
+        stop_fixture_server(server)
+        os.chdir(previous_folder)
+        if keep_output:
+            print(f"Replay output kept in {scratch_folder}")
+        else:
+            shutil.rmtree(scratch_folder, ignore_errors=True)
+
+    for step_name, seconds in step_times.items():
+        print(f"{step_name}: {seconds:.2f} sec")
+
+    return step_times
@@ -0,0 +1,65 @@
+import os
+import json
+import shutil
+
+
+# In-browser script returning a table's full html, or null if the table is not on the page
+TABLE_HTML_SCRIPT = """
+const table = document.getElementById(arguments[0]);
+return table ? table.outerHTML : null;
+"""
+
+
+# Create a recording that captures what the scrapers see, for replay through the local fixture server
+def create_recording(recording_dir):
+    if not os.path.exists(recording_dir):
+        os.makedirs(recording_dir)
+
+    return {'recording_dir': recording_dir, 'test_buttons': [], 'tests': {}, 'grade_levels': {},
+            'download_file': None}
+
+
+# Record the labels of the test buttons on the reporting page, in page order
+def record_test_buttons(recorder, button_labels):
+    if recorder is None:
+        return
+    recorder['test_buttons'] = list(button_labels)
+
+
+# Record the html of a reporting table as rendered for one test
+def record_table(recorder, driver, test, table_id):
+    if recorder is None:
+        return
+    recorder['tests'].setdefault(test, {})[table_id] = driver.execute_script(TABLE_HTML_SCRIPT, table_id)
+
+
+# Record the checked entries shown in the student list for one grade level group
+def record_grade_level(recorder, label, checked_names):
+    if recorder is None:
+        return
+    recorder['grade_levels'][label] = list(checked_names)
+
+
+# Copy the All_Students download into the recording
+def record_download(recorder, downloaded_file):
+    if recorder is None or downloaded_file is None:
+        return
+    recorder['download_file'] = os.path.basename(downloaded_file)
+    shutil.copy(downloaded_file, os.path.join(recorder['recording_dir'], recorder['download_file']))
+
+
+# Save the recording so it can be replayed offline
+def save_recording(recorder):
+    recording = {key: value for key, value in recorder.items() if key != 'recording_dir'}
+    path = os.path.join(recorder['recording_dir'], 'recording.json')
+    with open(path, 'w') as f:
+        json.dump(recording, f, indent=4)
+    print(f"Scrape recording saved: {path}")
+
+    return path
+
+
+# Load a saved recording
+def load_recording(recording_dir):
+    with open(os.path.join(recording_dir, 'recording.json'), 'r') as f:
+        return json.load(f)
@@ -0,0 +1,94 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from data_cleaning_functions import first_name_last_initial
+
+
+FIRST_NAMES = ['Ava', 'Ben', 'Cara', 'Dev', 'Ella', 'Finn', 'Gia', 'Hugo', 'Isla', 'Jack', 'Kira', 'Leo', 'Maya',
+               'Noah', 'Olive', 'Paz', 'Quinn', 'Rosa', 'Sam', 'Tess', 'Uma', 'Vik', 'Wren', 'Xavi', 'Yara', 'Zane']
+LAST_NAMES = ['Adams', 'Brooks', 'Chen', 'Diaz', 'Evans', 'Foster', 'Garcia', 'Hayes', 'Ito', 'Jones', 'Khan',
+              'Lopez', 'Miller', 'Nguyen', 'Ortiz', 'Patel', 'Quinn', 'Reyes', 'Smith', 'Torres', 'Usman', 'Vance',
+              'Wong', 'Young', 'Zhang']
+SEASONS = ['Fall', 'Winter', 'Spring']
+
+# Test name prefixes and the All_Students date column prefixes add_date_data maps back onto them
+SUBJECTS = {'math': ('Basic Math', 'MATH_BASIC'), 'reading': ('Basic Reading', 'RDG_BASIC')}
+
+
+# Roster names in the "Last, First" form the student tables use. The last names all have different initials, and the
+# suffix goes on the first name, so the "First L" keys of the incorrect names column stay unique in large districts
+def synthetic_student_names(student_count):
+    names = []
+    for idx in range(student_count):
+        first_name = FIRST_NAMES[idx % len(FIRST_NAMES)]
+        last_name = LAST_NAMES[(idx // len(FIRST_NAMES)) % len(LAST_NAMES)]
+        suffix = idx // (len(FIRST_NAMES) * len(LAST_NAMES))
+        names.append(f"{last_name}, {first_name}{suffix if suffix else ''}")
+
+    return names
+
+
+# Write realistic scraped inputs for a synthetic district under root_folder, laid out the way the scrapers and
+# cleaning stages expect them relative to the working directory's parent
+def generate_district_data(root_folder, students=500, tests=3, items=30, categories=5, accounts=2,
+                           grades=(3, 4, 5), subjects=('math',), seed=0):
+    rng = np.random.default_rng(seed)
+    student_names = synthetic_student_names(students)
+    student_grades = rng.choice(grades, size=students)
+    student_accounts = rng.integers(0, accounts, size=students)
+    category_names = [f"Category {chr(ord('A') + idx)}" for idx in range(categories)]
+    test_windows = [f"{SEASONS[idx % len(SEASONS)]}{idx // len(SEASONS) + 1 if idx >= len(SEASONS) else ''}"
+                    for idx in range(tests)]
+
+    test_lists = {}
+    for account_idx in range(accounts):
+        username = f"admin{account_idx + 1}"
+        extracted_folder = os.path.join(root_folder, 'Extracted Data Frames', username)
+        combined_folder = os.path.join(root_folder, 'Combined Frames by User', username)
+        os.makedirs(extracted_folder, exist_ok=True)
+        os.makedirs(combined_folder, exist_ok=True)
+
+        account_students = np.flatnonzero(student_accounts == account_idx)
+        date_frame = pd.DataFrame({
+            'Last Name': [student_names[idx].split(', ')[0] for idx in account_students],
+            'First Name': [student_names[idx].split(', ')[1] for idx in account_students],
+        })
+
+        test_lists[username] = []
+        for subject in subjects:
+            test_prefix, date_prefix = SUBJECTS[subject]
+            for grade in grades:
+                grade_students = [idx for idx in account_students if student_grades[idx] == grade]
+                grade_rows = np.isin(account_students, grade_students)
+                for window_idx, window in enumerate(test_windows):
+                    test = f"{test_prefix} {grade} {window}"
+                    test_lists[username].append(test)
+
+                    # Each student misses each item with a probability drawn around their own skill level
+                    skill = rng.uniform(0.5, 0.95, size=len(grade_students))
+                    missed = rng.random((len(grade_students), items)) > skill[:, None]
+                    name_keys = [first_name_last_initial(student_names[idx]) for idx in grade_students]
+                    pd.DataFrame({
+                        'Item': range(1, items + 1),
+                        'Type': rng.choice(category_names, size=items),
+                        'Student Names, Incorrect': [', '.join(key for key, miss in zip(name_keys, missed[:, item])
+                                                               if miss) for item in range(items)],
+                    }).to_csv(os.path.join(extracted_folder, f'{username}_{test}_test_data.csv'), index=False)
+                    pd.DataFrame({
+                        'Student Name': [student_names[idx] for idx in grade_students],
+                        'Score': np.round((1 - missed.mean(axis=1)) * 100),
+                    }).to_csv(os.path.join(extracted_folder, f'{username}_{test}_student_data.csv'), index=False)
+
+                    test_date = pd.Timestamp(2023, 9, 15) + pd.DateOffset(months=4 * window_idx)
+                    dates = np.where(grade_rows, test_date.strftime('%m/%d/%Y'), None)
+                    date_frame[f"{date_prefix}: {grade}_{window} - Date"] = dates
+
+        date_frame.to_csv(os.path.join(combined_folder, f"All_Students_{username}.csv"), index=False)
+
+    grade_levels_dict = {f"Grade {grade}": [student_names[idx] for idx in range(students) if student_grades[idx] == grade]
+                         for grade in grades}
+    with open(os.path.join(root_folder, "grade_levels_dict.json"), "w") as f:
+        json.dump(grade_levels_dict, f, indent=4)
+
+    return test_lists, grade_levels_dict
@@ -0,0 +1,41 @@
+import os
+import glob
+import pandas as pd
+
+
+# Suffixes of files Chrome and other browsers write while a download is still in progress
+PARTIAL_DOWNLOAD_SUFFIXES = ('.crdownload', '.tmp', '.part')
+
+
+# Modification times of the finished test date files currently in the download directory
+def test_date_file_times(download_dir):
+    file_times = {}
+    for file_path in glob.glob(os.path.join(download_dir, "All_Students*")):
+        if not file_path.endswith(PARTIAL_DOWNLOAD_SUFFIXES):
+            try:
+                file_times[file_path] = os.path.getmtime(file_path)
+            except OSError:
+                continue
+
+    return file_times
+
+
+# Whether a downloaded test date file is complete enough to parse and has the name columns used for joining
+def test_date_file_is_complete(file_path):
+    try:
+        date_frame = pd.read_csv(file_path)
+    except (OSError, ValueError):
+        return False
+
+    return {'Last Name', 'First Name'}.issubset(date_frame.columns)
+
+
+# The newest complete test date file in a download folder. This is the file save_test_date_data detected (or fell
+# back to), so dates from an older download left in the folder are never joined
+def newest_test_date_file(download_dir):
+    file_times = test_date_file_times(download_dir)
+    for file_path in sorted(file_times, key=file_times.get, reverse=True):
+        if test_date_file_is_complete(file_path):
+            return file_path
+
+    raise FileNotFoundError(f"No complete All_Students test date file in {download_dir}")